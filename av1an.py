@@ -3,30 +3,42 @@
 import time
 import json
 import re
-from tqdm import tqdm
 import sys
 import os
 import shutil
 import atexit
-from distutils.spawn import find_executable
-from ast import literal_eval
+import secrets
 from psutil import virtual_memory
 import argparse
 from multiprocessing import Pool
 import multiprocessing
 import subprocess
+import threading
+from queue import Queue, Empty
+from concurrent.futures import ThreadPoolExecutor
 from subprocess import PIPE, STDOUT
 from pathlib import Path
-import cv2
-import numpy as np
-import statistics
-from scipy import interpolate
 from math import isnan
-import matplotlib.pyplot as plt
-from scenedetect.video_manager import VideoManager
-from scenedetect.scene_manager import SceneManager
-from scenedetect.detectors import ContentDetector
-from multiprocessing.managers import BaseManager
+from functools import partial
+import encode_progress
+from balancer import balance, makespan, share
+from container import ChunkMuxer, frame_count
+from cq_model import CQModel
+from encode_progress import FrameCounters, Renderer
+from farm import ChunkFarm, Heartbeat, serve, connect, node_name
+from governor import Governor
+from journal import Journal
+import log_writer
+from log_writer import LogWriter
+from probe import ProbeCache
+from scenes import ScoreCache, frame_scores, cuts_from_scores, downscale_factor, opencv_scores, ffmpeg_scores
+from scheduler import ThroughputModel, ChunkScheduler
+from util import state_dir
+import y4m_cache
+from y4m_cache import Y4MCache, frame_bytes
+
+# numpy, scipy, matplotlib, cv2 and scenedetect are imported by subsystems that use them,
+# so runs without scene detection, boost, target vmaf or plots don't pay for loading them
 
 if sys.version_info < (3, 6):
     print('Python 3.6+ required')
@@ -38,26 +50,11 @@ if sys.platform == 'linux':
     atexit.register(restore_term)
 
 
-# Stuff for updating encoded progress in real-time
-class MyManager(BaseManager):
-    pass
-
-
-def Manager():
-    m = MyManager()
-    m.start()
-    return m
-
-
-class Counter(object):
-    def __init__(self, total, initial):
-        self.bar = tqdm(total=total, initial=initial, dynamic_ncols=True, unit="fr", leave=True, smoothing=0.01)
-
-    def update(self, value):
-        self.bar.update(value)
-
-
-MyManager.register('Counter', Counter)
+def init_worker(counters, y4m, log_queue):
+    """Pool worker setup, shared progress counters, y4m cache and log queue."""
+    encode_progress.init_worker(counters)
+    y4m_cache.init_worker(y4m)
+    log_writer.init_worker(log_queue)
 
 
 class Av1an:
@@ -66,45 +63,21 @@ class Av1an:
         """Av1an - Python all-in-one toolkit for AV1, VP9, VP8 encodes."""
         self.FFMPEG = 'ffmpeg -y -hide_banner -loglevel error '
         self.d = dict()
+        # Contents of temp/chunks.json, loaded once
+        self.plan = None
         self.encoders = {'svt_av1': 'SvtAv1EncApp', 'rav1e': 'rav1e', 'aom': 'aomenc', 'vpx': 'vpxenc'}
 
     @staticmethod
-    def read_vmaf_xml(file):
-        with open(file, 'r') as f:
-            file = f.readlines()
-            file = [x.strip() for x in file if 'vmaf="' in x]
-            vmafs = []
-            for i in file:
-                vmf = i[i.rfind('="') + 2: i.rfind('"')]
-                vmafs.append(float(vmf))
-
-            vmafs = [round(float(x), 5) for x in vmafs if type(x) == float]
-
-        # Data
-        x = [x for x in range(len(vmafs))]
-
-        calc = [x for x in vmafs if isinstance(x, float) and not isnan(x)]
-        mean = round(sum(calc) / len(calc), 2)
-        perc_1 = round(np.percentile(calc, 1), 2)
-        perc_25 = round(np.percentile(calc, 25), 2)
-        perc_75 = round(np.percentile(calc, 75), 2)
+    def read_vmaf(file):
+        """Per frame vmaf and its statistics from libvmaf log, parsed scores are cached in .npy next to log."""
+        import numpy as np
+        from vmaf import load_scores, score_stats
 
-        return x, vmafs, mean, perc_1, perc_25, perc_75
+        vmafs = load_scores(file)
+        mean, perc_1, perc_25, perc_75 = score_stats(vmafs)
+        x = np.arange(len(vmafs))
 
-    @staticmethod
-    def get_keyframes(file):
-        """ Read file info and return list of all keyframes """
-        cmd = ["ffmpeg", "-hide_banner", "-i", file.absolute(), "-vf", "showinfo", "-f", "null", "-"]
-        pipe = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
-        keyframes = []
-        while True:
-            line = pipe.stdout.readline().strip()
-            if len(line) == 0 and pipe.poll() is not None:
-                break
-            if "iskey:1" in line:
-                r = re.findall(r"n: *([^ ]+?) ", line)
-                keyframes.append(int(r[0]))
-        return keyframes
+        return x, vmafs, mean, perc_1, perc_25, perc_75
 
     @staticmethod
     def get_cq(command):
@@ -119,56 +92,63 @@ class Av1an:
         cmd = command[:command.find(mt) + 11] + str(cq) + command[command.find(mt) + 13:]
         return cmd
 
-    @staticmethod
-    def frame_probe(source: Path):
-        """Get frame count."""
-        cmd = ["ffmpeg", "-hide_banner", "-i", source.absolute(), "-map", "0:v:0", "-f", "null", "-"]
-        r = subprocess.run(cmd, stdout=PIPE, stderr=PIPE)
-        matches = re.findall(r"frame=\s*([0-9]+)\s", r.stderr.decode("utf-8") + r.stdout.decode("utf-8"))
-        return int(matches[-1])
+    def get_brightness(self, video: Path):
+        """Getting average brightness value for single video, cached per chunk."""
+        from brightness import luma_means, geometric_mean
 
-    @staticmethod
-    def get_brightness(video):
-        """Getting average brightness value for single video."""
-        brightness = []
-        cap = cv2.VideoCapture(video)
-        try:
-            while True:
-                # Capture frame-by-frame
-                _, frame = cap.read()
+        probe = ProbeCache(self.d.get('temp') / 'probe')
+        sample = self.d.get('boost_sample')
+
+        plan = self.chunk_plan()
+        if plan and video.name in plan['chunks']:
+            # Range of input, cached under input
+            start, frames = plan['chunks'][video.name]
+            args = self.chunk_input(video).split()
+
+            def measure_range(source):
+                info = probe.stream(source)
+                return geometric_mean(luma_means(source, info['width'], info['height'], sample=sample, args=args))
+
+            return probe.get(self.d.get('input'), f'luma_{sample}_{start}_{frames}', measure_range)
 
-                # Our operations on the frame come here
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        def measure(source):
+            info = probe.stream(source)
+            return geometric_mean(luma_means(source, info['width'], info['height'], sample=sample))
 
-                # Display the resulting frame
-                mean = cv2.mean(gray)
-                brightness.append(mean[0])
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
-        except cv2.error:
-            pass
+        return probe.get(video, f'luma_{sample}', measure)
 
-        # When everything done, release the capture
-        cap.release()
-        brig_geom = round(statistics.geometric_mean([x + 1 for x in brightness]), 1)
+    def frame_probe(self, source: Path):
+        """Get frame count, cached in temp folder."""
+        return ProbeCache(self.d.get('temp') / 'probe').frames(source)
 
-        return brig_geom
+    def encoded_frames(self, encoded: Path):
+        """Frame count of encoded chunk from IVF frame headers, without decoding."""
+        frames = frame_count(encoded)
+        return self.frame_probe(encoded) if frames is None else frames
 
     def log(self, info):
-        """Default logging function, write to file."""
-        with open(self.d.get('logging'), 'a') as log:
-            log.write(time.strftime('%X') + ' ' + info)
+        """Default logging function, sent to log writer or written to file directly when it isn't running."""
+        info = time.strftime('%X') + ' ' + info
+        if not log_writer.write(info):
+            with open(self.d.get('logging'), 'a') as log:
+                log.write(info)
+
+    def event(self, kind, **data):
+        """Structured event for metrics file."""
+        log_writer.event(kind, input=Path(self.d.get('input')).name, **data)
 
     def call_cmd(self, cmd, capture_output=False):
         """Calling system shell, if capture_output=True output string will be returned."""
         if capture_output:
             return subprocess.run(cmd, shell=True, stdout=PIPE, stderr=STDOUT).stdout
 
-        with open(self.d.get('logging'), 'a') as log:
-            subprocess.run(cmd, shell=True, stdout=log, stderr=log)
+        output = subprocess.run(cmd, shell=True, stdout=PIPE, stderr=STDOUT).stdout
+        if output and not log_writer.write(output.decode(errors='replace')):
+            with open(self.d.get('logging'), 'ab') as log:
+                log.write(output)
 
     def check_executables(self):
-        if not find_executable('ffmpeg'):
+        if not shutil.which('ffmpeg'):
             print('No ffmpeg')
             sys.exit()
 
@@ -176,7 +156,7 @@ class Av1an:
         if self.d.get('encoder') in self.encoders:
             enc = self.encoders.get(self.d.get('encoder'))
 
-            if not find_executable(enc):
+            if not shutil.which(enc):
                 print(f'Encoder {enc} not found')
                 sys.exit()
         else:
@@ -190,10 +170,10 @@ class Av1an:
             sys.exit()
 
         inputs = self.d.get('input')
-        valid = np.array([i.exists() for i in inputs])
+        missing = [str(i) for i in inputs if not i.exists()]
 
-        if not all(valid):
-            print(f'File(s) do not exist: {", ".join([str(inputs[i]) for i in np.where(valid == False)[0]])}')
+        if missing:
+            print(f'File(s) do not exist: {", ".join(missing)}')
             sys.exit()
 
         if len(inputs) > 1:
@@ -223,6 +203,10 @@ class Av1an:
         self.d['pix_format'] = f'-strict -1 -pix_fmt {self.d.get("pix_format")}'
         self.d['ffmpeg_pipe'] = f' {self.d.get("ffmpeg")} {self.d.get("pix_format")} -f yuv4mpegpipe - |'
 
+        if self.d.get('split_method') == 'range' and self.d.get('mode') == 1:
+            print('Range split is not supported in master mode, chunk files are sent to encoders')
+            sys.exit()
+
         # Make sure that vmaf calculated after encoding
         if self.d.get('vmaf_target'):
             self.d['vmaf'] = True
@@ -245,13 +229,27 @@ class Av1an:
         # PySceneDetect split
         parser.add_argument('--scenes', '-s', type=str, default=None, help='File location for scenes')
         parser.add_argument('--threshold', '-tr', type=float, default=50, help='PySceneDetect Threshold')
+        parser.add_argument('--scene_method', type=str, default='pyscene', choices=['pyscene', 'numpy'],
+                            help='Scene detection decoding: pyscene decodes with OpenCV as PySceneDetect does, '
+                                 'numpy scores ffmpeg stream in blocks of frames (experimental)')
+        parser.add_argument('--scene_workers', type=int, default=1,
+                            help='Processes for scene detection, more than 1 detects time ranges in parallel')
         parser.add_argument('--extra_split', '-xs', type=int, default=0, help='Number of frames after which make split')
+        parser.add_argument('--min_split', type=int, default=0, help='Merge scenes shorter than this number of frames')
+        parser.add_argument('--split_method', type=str, default='segment', choices=['segment', 'range'],
+                            help='segment - split input into chunk files, '
+                                 'range - chunks are frame ranges read straight from input')
 
         # Encoding
         parser.add_argument('--passes', '-p', type=int, default=2, help='Specify encoding passes')
         parser.add_argument('--video_params', '-v', type=str, default='', help='encoding settings')
         parser.add_argument('--encoder', '-enc', type=str, default='aom', help='Choosing encoder')
         parser.add_argument('--workers', '-w', type=int, default=0, help='Number of workers')
+        parser.add_argument('--y4m_cache', type=int, default=0,
+                            help='Two pass: decode and filter source once, keeping at most N chunks in cache')
+        parser.add_argument('--y4m_cache_size', type=float, default=4, help='Y4M cache size limit in GiB')
+        parser.add_argument('--y4m_cache_dir', type=Path, default=None,
+                            help='Folder for y4m cache (default: /dev/shm if present, else temp folder)')
         parser.add_argument('-cfg', '--config', type=Path, help='Parameters file. Save/Read: '
                                                                 'Video, Audio, Encoder, FFmpeg parameteres')
 
@@ -262,6 +260,9 @@ class Av1an:
 
         # Misc
         parser.add_argument('--logging', '-log', type=str, default=None, help='Enable logging')
+        parser.add_argument('--metrics', type=Path, default=None,
+                            help='Json-lines file for per chunk metrics, appended by every run, '
+                                 'default is metrics.jsonl in temp folder, removed with it')
         parser.add_argument('--resume', '-r', help='Resuming previous session', action='store_true')
         parser.add_argument('--no_check', '-n', help='Do not check encodings', action='store_true')
         parser.add_argument('--keep', help='Keep temporally folder after encode', action='store_true')
@@ -271,6 +272,7 @@ class Av1an:
                                             'Darker = lower CQ', action='store_true')
         parser.add_argument('--boost_range', default=15, type=int, help='Range/strength of CQ change')
         parser.add_argument('--boost_limit', default=10, type=int, help='CQ limit for boosting')
+        parser.add_argument('--boost_sample', default=1, type=int, help='Measure brightness of every Nth frame')
 
         # Grain
         parser.add_argument('--grain', help='Exprimental feature, adds generated grain based on video brightness',
@@ -280,16 +282,29 @@ class Av1an:
         # Vmaf
         parser.add_argument('--vmaf', help='Calculating vmaf after encode', action='store_true')
         parser.add_argument('--vmaf_path', type=Path, default=None, help='Path to vmaf models')
+        parser.add_argument('--vmaf_chunks', help='Calculate vmaf of every chunk after its encode, '
+                                                  'instead of whole video after concatenation', action='store_true')
 
         # Target Vmaf
         parser.add_argument('--vmaf_target', type=float, help='Value of Vmaf to target')
         parser.add_argument('--vmaf_error', type=float, default=0.0, help='Error to compensate to wrong target vmaf')
-        parser.add_argument('--vmaf_steps', type=int, default=4, help='Steps between min and max qp for target vmaf')
+        parser.add_argument('--vmaf_steps', type=int, default=4,
+                            help='Steps between min and max qp for target vmaf, probe limit for adaptive search')
         parser.add_argument('--min_cq', type=int, default=25, help='Min cq for target vmaf')
         parser.add_argument('--max_cq', type=int, default=50, help='Max cq for target vmaf')
+        parser.add_argument('--vmaf_search', type=str, default='adaptive', choices=['adaptive', 'grid'],
+                            help='Target vmaf search, adaptive bisection/secant or full grid of vmaf_steps')
+        parser.add_argument('--vmaf_threads', type=int, default=0,
+                            help='Concurrent target vmaf probes per worker, 0 - cpu count / workers')
+        parser.add_argument('--no_cq_model', help='Always run full target vmaf probe search, '
+                                                  'without CQ predicted from earlier probes', action='store_true')
 
         # Server parts
-        parser.add_argument('--host', nargs='+', type=str, help='ips of encoders')
+        parser.add_argument('--host', nargs='+', type=str, default=None,
+                            help='Master: address to listen on (default: 127.0.0.1). Encoder: address of master')
+        parser.add_argument('--port', type=int, default=40000, help='Master port')
+        parser.add_argument('--authkey', type=str, default=None,
+                            help='Shared key of master and encoders, master generates and prints one if not set')
 
         # Store all vars in dictionary
         self.d = vars(parser.parse_args())
@@ -301,10 +316,16 @@ class Av1an:
             self.d['output_file'] = Path(f'{self.d.get("input").stem}_av1.mkv')
 
     def determine_resources(self):
-        """Returns number of workers that machine can handle with selected encoder."""
+        """
+        Returns number of workers that machine can handle with selected encoder.
+        With automatic workers pool can grow up to cpu count, governor admits chunks above this estimate
+        only while cpu and memory have room for them.
+        """
 
-        # If set by user, skip
+        # If set by user or already determined, skip
         if self.d.get('workers') != 0:
+            if not self.d.get('max_workers'):
+                self.d['max_workers'] = self.d.get('workers')
             return
 
         cpu = os.cpu_count()
@@ -320,6 +341,8 @@ class Av1an:
         if self.d.get('workers') == 0:
             self.d['workers'] = 1
 
+        self.d['max_workers'] = max(cpu, self.d.get('workers'))
+
     def set_logging(self):
         """Setting logging file."""
         if self.d.get('logging'):
@@ -327,6 +350,10 @@ class Av1an:
         else:
             self.d['logging'] = self.d.get('temp') / 'log.log'
 
+        # Metrics are kept between runs only in file given by user
+        metrics = self.d.get('metrics') or self.d.get('temp') / 'metrics.jsonl'
+        LogWriter(self.d.get('logging'), metrics).start()
+
     def setup(self):
         """Creating temporally folders when needed."""
         # Make temporal directories, and remove them if already presented
@@ -359,7 +386,7 @@ class Av1an:
                   f'{self.d.get("audio_params")} {audio_file}'
             self.call_cmd(cmd)
 
-    def call_vmaf(self, source: Path, encoded: Path, file=False):
+    def call_vmaf(self, source: Path, encoded: Path, file=False, log: Path = None):
 
         model: Path = self.d.get("vmaf_path")
         if model:
@@ -369,9 +396,10 @@ class Av1an:
 
         # For vmaf calculation both source and encoded segment scaled to 1080
         # for proper vmaf calculation
-        fl = source.with_name(encoded.stem).with_suffix('.xml').as_posix()
-        cmd = f'ffmpeg -hide_banner -r 60 -i {source.as_posix()} -r 60 -i {encoded.as_posix()}  ' \
-              f'-filter_complex "[0:v]scale=-1:1080:flags=spline[scaled1];' \
+        fl = (log or source.with_name(encoded.stem).with_suffix('.xml')).as_posix()
+        reference, retime = self.vmaf_reference(source)
+        cmd = f'ffmpeg -hide_banner {reference} -r 60 -i {encoded.as_posix()}  ' \
+              f'-filter_complex "[0:v]{retime}scale=-1:1080:flags=spline[scaled1];' \
               f'[1:v]scale=-1:1080:flags=spline[scaled2];' \
               f'[scaled2][scaled1]libvmaf=log_path={fl}{mod}" -f null - '
 
@@ -387,6 +415,43 @@ class Av1an:
             vmf = 0
         return vmf
 
+    def vmaf_reference(self, source: Path):
+        """
+        FFmpeg input of vmaf reference and filter that retimes it.
+        Both sides are read as 60 fps so their frames pair up, but -r before -ss/-t of range input
+        would retime input before trim, so range is retimed after it in filter.
+        """
+        reference = self.chunk_input(source)
+        plan = self.chunk_plan()
+        if plan and source.name in plan['chunks']:
+            return reference, 'setpts=N/(60*TB),'
+        return f'-r 60 {reference}', ''
+
+    def call_vmaf_multi(self, source: Path, encoded, logs=None):
+        """
+        Vmaf of several encodes of one source in single ffmpeg run, returns paths of their logs.
+        Source is decoded and scaled once, then split to libvmaf instance of every encode.
+        """
+        model: Path = self.d.get("vmaf_path")
+        mod = f":model_path={model}" if model else ''
+        logs = logs or [source.with_name(x.stem).with_suffix('.xml') for x in encoded]
+        count = len(encoded)
+        # Vmaf threads of worker are shared by all libvmaf instances
+        threads = max(1, self.vmaf_threads() // count)
+
+        reference, retime = self.vmaf_reference(source)
+        graph = [f'[0:v]{retime}scale=-1:1080:flags=spline,split={count}' + ''.join(f'[ref{i}]' for i in range(count))]
+        for i, log in enumerate(logs):
+            graph.append(f'[{i + 1}:v]scale=-1:1080:flags=spline[dis{i}]')
+            graph.append(f'[dis{i}][ref{i}]libvmaf=log_path={log.as_posix()}{mod}:n_threads={threads}[out{i}]')
+
+        inputs = ' '.join(f'-r 60 -i {x.as_posix()}' for x in encoded)
+        outputs = ' '.join(f'-map [out{i}] -f null -' for i in range(count))
+        cmd = f'ffmpeg -hide_banner {reference} {inputs} ' \
+              f'-filter_complex "{";".join(graph)}" {outputs}'
+        self.call_cmd(cmd, capture_output=True)
+        return logs
+
     def reduce_scenes(self, scenes):
         """Windows terminal can't handle more than ~600 scenes in length."""
         if len(scenes) > 600:
@@ -394,6 +459,20 @@ class Av1an:
             self.reduce_scenes(scenes)
         return scenes
 
+    def score_cache(self, video: Path):
+        """Scene score cache of video, its downscale factor and range scoring function of scene method."""
+        stream = ProbeCache(self.d.get('temp') / 'probe').stream(video)
+        downscale = downscale_factor(stream['width'])
+        method = self.d.get('scene_method')
+        settings = {'detector': 'content', 'downscale': downscale}
+        if method == 'numpy':
+            scorer = partial(ffmpeg_scores, stream)
+            settings['method'] = method
+        else:
+            scorer = opencv_scores
+        cache = ScoreCache(state_dir() / 'scenes', video, settings)
+        return cache, downscale, scorer
+
     def scene_detect(self, video: Path):
         """
         Running PySceneDetect detection on source video for segmenting.
@@ -405,11 +484,6 @@ class Av1an:
             return ''
 
         try:
-            video_manager = VideoManager([str(video)])
-            scene_manager = SceneManager()
-            scene_manager.add_detector(ContentDetector(threshold=self.d.get('threshold')))
-            base_timecode = video_manager.get_base_timecode()
-
             # If stats file exists, load it.
             scenes = self.d.get('scenes')
             if scenes:
@@ -421,29 +495,21 @@ class Av1an:
                         self.log('Using Saved Scenes\n')
                         return stats
 
-            # Work on whole video
-            video_manager.set_duration()
-
-            # Set downscale factor to improve processing speed.
-            video_manager.set_downscale_factor()
+            probe = ProbeCache(self.d.get('temp') / 'probe')
+            cache, downscale, scorer = self.score_cache(video)
 
-            # Start video_manager.
-            video_manager.start()
-
-            # Perform scene detection on video_manager.
             self.log(f'Starting scene detection Threshold: {self.d.get("threshold")}\n')
 
             # Fix for cli batch encoding
             progress = False if self.d.get('queue') else True
 
-            scene_manager.detect_scenes(frame_source=video_manager, show_progress=progress)
-
-            # Obtain list of detected scenes.
-            scene_list = scene_manager.get_scene_list(base_timecode)
+            # Scores are cached per source, so other threshold doesn't decode it again
+            scores = frame_scores(video, self.frame_probe(video), probe.keyframes(video),
+                                  self.d.get('scene_workers'), downscale, cache, progress, scorer)
+            cuts = cuts_from_scores(scores, self.d.get('threshold'))
+            scenes = [str(x) for x in [0] + cuts]
 
-            self.log(f'Found scenes: {len(scene_list)}\n')
-
-            scenes = [str(scene[0].get_frames()) for scene in scene_list]
+            self.log(f'Found scenes: {len(scenes)}\n')
 
             # Fix for windows character limit
             if sys.platform != 'linux':
@@ -463,6 +529,9 @@ class Av1an:
 
     def split(self, video: Path, frames):
         """Split video by frame numbers, or just copying video."""
+        self.plan_chunks(video, frames)
+        if self.d.get('split_method') == 'range':
+            return
 
         cmd = [
             "ffmpeg", "-hide_banner", "-y",
@@ -485,51 +554,181 @@ class Av1an:
             if len(line) == 0 and pipe.poll() is not None:
                 break
 
-    def frame_check(self, source: Path, encoded: Path):
-        """Checking is source and encoded video frame count match."""
+    def plan_chunks(self, video: Path, frames):
+        """
+        Frame ranges of chunks are saved to temp/chunks.json.
+        In range split mode chunks are read from input by them instead of splitting video.
+        """
+        total = self.frame_probe(video)
+        cuts = [int(x) for x in frames.split(',') if x] if frames else []
+        cuts = sorted({0, total, *(x for x in cuts if 0 < x < total)})
+        chunks = {f'{n:05d}.mkv': [start, end - start] for n, (start, end) in enumerate(zip(cuts, cuts[1:]))}
+
+        stream = ProbeCache(self.d.get('temp') / 'probe').stream(video)
+        fps = stream['fps']
+        if self.d.get('split_method') == 'range' and (fps <= 0 or stream.get('vfr', True)):
+            # Frames are seeked by timestamp, which is frame number / fps only at constant frame rate
+            self.log('Unknown or variable frame rate, falling back to segment split\n')
+            print('Unknown or variable frame rate, using segment split')
+            self.d['split_method'] = 'segment'
+
+        self.plan = {'fps': fps, 'chunks': chunks, 'motion': self.plan_motion(video, total, chunks)}
+        with (self.d.get('temp') / 'chunks.json').open('w') as f:
+            json.dump(self.plan, f)
+        self.log(f'Planned {len(chunks)} chunks\n')
+
+    def load_plan(self):
+        """Chunk plan of temp/chunks.json, read once, empty if there is no plan."""
+        if self.plan is None:
+            try:
+                with (self.d.get('temp') / 'chunks.json').open() as f:
+                    self.plan = json.load(f)
+            except (OSError, ValueError):
+                self.plan = {}
+        return self.plan
+
+    def chunk_plan(self):
+        """Frame ranges of chunks in range split mode, None when video is split into files."""
+        if self.d.get('split_method') != 'range':
+            return None
+        plan = self.load_plan()
+        # Plan without frame rate fell back to segment split
+        return plan if plan.get('fps') else None
+
+    def input_stream(self):
+        """Stream info of input, encoder nodes get it from master as they don't have input."""
+        return self.d.get('input_stream') or ProbeCache(self.d.get('temp') / 'probe').stream(self.d.get('input'))
+
+    def chunk_size(self, source: Path, frames):
+        """Size of chunk source, estimated from average bitrate of input in range mode."""
+        if self.chunk_plan():
+            return frames * self.d.get('input').stat().st_size / max(1, self.frame_probe(self.d.get('input')))
+        return source.stat().st_size
+
+    def plan_motion(self, video: Path, total, chunks):
+        """
+        Mean content score of frames of every chunk from scene score cache, for CQ model.
+        Only in range mode, where planned ranges are exact, segment split cuts at keyframes instead.
+        """
+        if self.d.get('split_method') != 'range' or not self.d.get('vmaf_target') or self.d.get('scenes') == '0':
+            return {}
+        cache, _, _ = self.score_cache(video)
+        scores = cache.scores(total)
+        if scores is None:
+            return {}
+        return {name: float(scores[start:start + frames].mean()) for name, (start, frames) in chunks.items()}
+
+    def chunk_motion(self, source: Path):
+        """Planned motion of chunk, None if it isn't known."""
+        plan = self.chunk_plan()
+        return plan.get('motion', {}).get(source.name) if plan else None
+
+    def cq_features(self, source: Path):
+        """Features of chunk for CQ model."""
+        frames = self.chunk_frames(source)
+        info = self.input_stream()
+        bpp = self.chunk_size(source, frames) * 8 / max(1, frames * info['width'] * info['height'])
+        return {'frames': frames, 'bpp': bpp, 'brightness': self.get_brightness(source),
+                'motion': self.chunk_motion(source)}
+
+    def chunk_names(self):
+        """Names of all chunks in output order."""
+        plan = self.chunk_plan()
+        if plan:
+            return sorted(plan['chunks'])
+        return sorted(x.name for x in (self.d.get('temp') / 'split').iterdir() if x.suffix == '.mkv')
+
+    def chunk_frames(self, source: Path):
+        """Frame count of chunk."""
+        plan = self.chunk_plan()
+        if plan and source.name in plan['chunks']:
+            return plan['chunks'][source.name][1]
+        return self.frame_probe(source)
+
+    def chunk_input(self, source: Path):
+        """
+        FFmpeg input arguments of chunk.
+        In range mode chunk is read straight from input, seek and duration are half a frame before
+        chunk boundaries, so decoder starts and stops at exact frames.
+        """
+        plan = self.chunk_plan()
+        if not plan or source.name not in plan['chunks']:
+            return f'-i {source.as_posix()}'
+
+        start, frames = plan['chunks'][source.name]
+        fps = plan['fps']
+        seek = f'-ss {(start - 0.5) / fps:.6f} ' if start else ''
+        duration = frames / fps if start else (frames - 0.5) / fps
+        return f'{seek}-t {duration:.6f} -i {Path(self.d.get("input")).absolute().as_posix()}'
+
+    def frame_check(self, source: Path, encoded: Path, enc_time=0):
+        """Checking is source and encoded video frame count match, returns True for verified chunk."""
         try:
-            status_file = Path(self.d.get("temp") / 'done.json')
-            with status_file.open() as f:
-                d = json.load(f)
+            journal = self.journal()
 
             if self.d.get("no_check"):
-                s1 = Av1an.frame_probe(source)
-                d['done'][source.name] = s1
-                with status_file.open('w') as f:
-                    json.dump(d, f)
-                    return
+                s1 = self.chunk_frames(source)
+                # Frames aren't counted, but failed encode is redone on resume instead of being muxed
+                if not encoded.exists() or not encoded.stat().st_size:
+                    journal.chunk(source.name, 'failed', frames=s1, time=enc_time)
+                    print(f'Encoded chunk missing for {source.name}')
+                    return False
+                journal.chunk(source.name, 'done', frames=s1, time=enc_time)
+                return True
 
-            s1, s2 = [Av1an.frame_probe(i) for i in (source, encoded)]
+            s1, s2 = self.chunk_frames(source), self.encoded_frames(encoded)
 
             if s1 == s2:
-                d['done'][source.name] = s1
-                with status_file.open('w') as f:
-                    json.dump(d, f)
-            else:
-                print(f'Frame Count Differ for Source {source.name}: {s2}/{s1}')
-        except IndexError:
+                journal.chunk(source.name, 'done', frames=s1, time=enc_time)
+                return True
+
+            journal.chunk(source.name, 'failed', frames=s1, encoded=s2, time=enc_time)
+            print(f'Frame Count Differ for Source {source.name}: {s2}/{s1}')
+            return False
+        except (IndexError, FileNotFoundError):
             print('Encoding failed, check validity of your encoding settings/commands and start again')
             sys.exit()
         except Exception as e:
             _, _, exc_tb = sys.exc_info()
             print(f'\nError frame_check: {e}\nAt line: {exc_tb.tb_lineno}\n')
 
+    def journal(self):
+        """Encoding progress journal of current temp folder."""
+        return Journal(self.d.get('temp') / 'done.jsonl')
+
+    def chunk_muxer(self):
+        """Muxer of encoded chunks into temp/video.ivf, state is restored from journal."""
+        return ChunkMuxer(self.d.get('temp') / 'video.ivf', self.journal(), self.d.get('temp') / 'encode',
+                          keep=self.d.get('keep'))
+
+    def reclaim(self, source: Path):
+        """Delete split source of verified chunk with its first pass and target vmaf probe files."""
+        if self.d.get('keep'):
+            return
+        for file in (*source.parent.glob(f'{source.stem}.*'), *source.parent.glob(f'v_*{source.stem}.ivf')):
+            file.unlink()
+
     def get_video_queue(self, source_path: Path):
         """Returns sorted list of all videos that need to be encoded. Big first."""
-        queue = [x for x in source_path.iterdir() if x.suffix == '.mkv']
+        plan = self.chunk_plan()
+        if plan:
+            queue = [source_path / x for x in plan['chunks']]
+        else:
+            queue = [x for x in source_path.iterdir() if x.suffix == '.mkv']
 
-        done_file = self.d.get('temp') / 'done.json'
-        if self.d.get('resume') and done_file.exists():
+        journal = self.journal()
+        if self.d.get('resume') and journal.exists():
             try:
-                with open(done_file) as f:
-                    data = json.load(f)
-                data = data['done'].keys()
-                queue = [x for x in queue if x.name not in data]
+                done = journal.done()
+                queue = [x for x in queue if x.name not in done]
             except Exception as e:
                 _, _, exc_tb = sys.exc_info()
                 print(f'Error at resuming {e}\nAt line {exc_tb.tb_lineno}')
 
-        queue = sorted(queue, key=lambda x: -x.stat().st_size)
+        if plan:
+            queue = sorted(queue, key=lambda x: -plan['chunks'][x.name][1])
+        else:
+            queue = sorted(queue, key=lambda x: -x.stat().st_size)
 
         if len(queue) == 0:
             # TODO: this could also be because we're resuming but everything
@@ -552,7 +751,7 @@ class Av1an:
 
         if passes == 1:
             pass_1_commands = [
-                (f'-i {file[0]} {pipe} ' +
+                (f'{self.chunk_input(file[0])} {pipe} ' +
                  f'  {encoder} -i stdin {params} -b {file[1].with_suffix(".ivf")} -',
                  (file[0], file[1].with_suffix('.ivf')))
                 for file in inputs]
@@ -562,9 +761,9 @@ class Av1an:
             p2i = '-input-stat-file '
             p2o = '-output-stat-file '
             pass_2_commands = [
-                (f'-i {file[0]} {pipe} {encoder} -i stdin {params} {p2o} '
+                (f'{self.chunk_input(file[0])} {pipe} {encoder} -i stdin {params} {p2o} '
                  f'{file[0].with_suffix(".stat")} -b {file[0]}.bk - ',
-                 f'-i {file[0]} {pipe} '
+                 f'{self.chunk_input(file[0])} {pipe} '
                  f'{encoder} -i stdin {params} {p2i} {file[0].with_suffix(".stat")} -b {file[1].with_suffix(".ivf")} - ',
                  (file[0], file[1].with_suffix('.ivf')))
                 for file in inputs]
@@ -590,15 +789,15 @@ class Av1an:
 
         if passes == 1:
             pass_1_commands = [
-                (f'-i {file[0]} {pipe} {single_p} {params} -o {file[1].with_suffix(".ivf")} - ',
+                (f'{self.chunk_input(file[0])} {pipe} {single_p} {params} -o {file[1].with_suffix(".ivf")} - ',
                  (file[0], file[1].with_suffix('.ivf')))
                 for file in inputs]
             return pass_1_commands
 
         if passes == 2:
             pass_2_commands = [
-                (f'-i {file[0]} {pipe} {two_p_1} {params} --fpf={file[0].with_suffix(".log")} -o {os.devnull} - ',
-                 f'-i {file[0]} {pipe} {two_p_2} {params} --fpf={file[0].with_suffix(".log")} -o {file[1].with_suffix(".ivf")} - ',
+                (f'{self.chunk_input(file[0])} {pipe} {two_p_1} {params} --fpf={file[0].with_suffix(".log")} -o {os.devnull} - ',
+                 f'{self.chunk_input(file[0])} {pipe} {two_p_2} {params} --fpf={file[0].with_suffix(".log")} -o {file[1].with_suffix(".ivf")} - ',
                  (file[0], file[1].with_suffix('.ivf')))
                 for file in inputs]
             return pass_2_commands
@@ -614,7 +813,7 @@ class Av1an:
 
         if passes == 1 or passes == 2:
             pass_1_commands = [
-                (f'-i {file[0]} {pipe} '
+                (f'{self.chunk_input(file[0])} {pipe} '
                  f' rav1e -  {params}  '
                  f'--output {file[1].with_suffix(".ivf")}',
                  (file[0], file[1].with_suffix('.ivf')))
@@ -624,10 +823,10 @@ class Av1an:
         # 2 encode pass not working with FFmpeg pipes :(
         if passes == 2:
             pass_2_commands = [
-                (f'-i {file[0]} {pipe} '
+                (f'{self.chunk_input(file[0])} {pipe} '
                  f' rav1e - --first-pass {file[0].with_suffix(".stat")} {params} '
                  f'--output {file[1].with_suffix(".ivf")}',
-                 f'-i {file[0]} {pipe} '
+                 f'{self.chunk_input(file[0])} {pipe} '
                  f' rav1e - --second-pass {file[0].with_suffix(".stat")} {params} '
                  f'--output {file[1].with_suffix(".ivf")}',
                  (file[0], file[1].with_suffix('.ivf')))
@@ -681,33 +880,84 @@ class Av1an:
             _, _, exc_tb = sys.exc_info()
             print(f'Error in encoding loop {e}\nAt line {exc_tb.tb_lineno}')
 
+    def chunk_vmaf(self, source: Path, encoded: Path):
+        """Vmaf of single encoded chunk against its split source, scores are cached as .npy in temp/vmaf."""
+        log = self.d.get('temp') / 'vmaf' / source.with_suffix('.xml').name
+        log.parent.mkdir(exist_ok=True)
+        self.call_vmaf(source, encoded, file=True, log=log)
+
+        if not log.exists():
+            print(f'Vmaf calculation failed for chunk {source.name}')
+            return None
+        return Av1an.read_vmaf(log)[2]
+
+    def chunks_vmaf(self):
+        """Per frame vmaf of whole video, assembled from chunk scores in chunk order."""
+        import numpy as np
+        from vmaf import load_scores, score_stats
+
+        # Expected chunks come from journal, split files are reclaimed or don't exist in range mode
+        journal = self.journal()
+        order = journal.order() or sorted(self.load_plan().get('chunks', {}))
+        _, chunks = journal.state()
+
+        scores, missing = [], []
+        for name in order:
+            log = self.d.get('temp') / 'vmaf' / Path(name).with_suffix('.xml').name
+            if log.exists():
+                scores.append(load_scores(log))
+            else:
+                # Frames of missing chunk stay as gap, so later chunks keep their frame numbers
+                missing.append(name)
+                frames = chunks.get(name, {}).get('frames') or self.load_plan().get('chunks', {}).get(name, [0, 0])[1]
+                scores.append(np.full(frames, np.nan))
+        if missing:
+            print(f'Vmaf missing for {len(missing)} of {len(order)} chunks: {", ".join(missing)}')
+
+        vmafs = np.concatenate(scores) if scores else np.zeros(0)
+        mean, perc_1, perc_25, perc_75 = score_stats(vmafs)
+        return np.arange(len(vmafs)), vmafs, mean, perc_1, perc_25, perc_75
+
     def plot_vmaf(self):
 
         if not self.d.get("vmaf"):
             return
-        print('Calculating Vmaf...\r', end='')
-        if self.d.get("vmaf_path"):
-            model = f'model_path={self.d.get("vmaf_path")}'
-        else:
-            model = ''
 
-        inp: Path = self.d.get('input')
-        out: Path = self.d.get('output_file')
-        xml: str = "vmaf.xml"
+        # Batch inputs are finished in thread, only non-interactive backend works outside of main thread
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
 
-        # For vmaf calculation both source and encoded segment scaled to 1080
-        # for proper vmaf calculation
-        cmd = f'ffmpeg -hide_banner -r 60 -i {inp.as_posix()} -r 60 -i {out.as_posix()}  ' \
-              f'-filter_complex "[0:v]scale=-1:1080:flags=spline[scaled1];' \
-              f'[1:v]scale=-1:1080:flags=spline[scaled2];' \
-              f'[scaled2][scaled1]libvmaf=log_path={xml}:{model}" -f null - '
-        self.call_cmd(cmd, capture_output=True)
+        if self.d.get('vmaf_chunks'):
+            x, vmafs, mean, perc_1, perc_25, perc_75 = self.chunks_vmaf()
+        else:
+            print('Calculating Vmaf...\r', end='')
+            if self.d.get("vmaf_path"):
+                model = f'model_path={self.d.get("vmaf_path")}'
+            else:
+                model = ''
+
+            inp: Path = self.d.get('input')
+            out: Path = self.d.get('output_file')
+            xml: str = "vmaf.xml"
+
+            # For vmaf calculation both source and encoded segment scaled to 1080
+            # for proper vmaf calculation
+            cmd = f'ffmpeg -hide_banner -r 60 -i {inp.as_posix()} -r 60 -i {out.as_posix()}  ' \
+                  f'-filter_complex "[0:v]scale=-1:1080:flags=spline[scaled1];' \
+                  f'[1:v]scale=-1:1080:flags=spline[scaled2];' \
+                  f'[scaled2][scaled1]libvmaf=log_path={xml}:{model}" -f null - '
+            self.call_cmd(cmd, capture_output=True)
+
+            if not Path(xml).exists():
+                print(f'Vmaf calculation failed for files:\n {inp.stem} {out.stem}')
+                sys.exit()
 
-        if not Path(xml).exists():
-            print(f'Vmaf calculation failed for files:\n {inp.stem} {out.stem}')
-            sys.exit()
+            x, vmafs, mean, perc_1, perc_25, perc_75 = Av1an.read_vmaf(xml)
 
-        x, vmafs, mean, perc_1, perc_25, perc_75 = Av1an.read_vmaf_xml(xml)
+        if len(vmafs) == 0:
+            print('No vmaf scores to plot')
+            return
 
         # Plot
         plt.figure(figsize=(15, 4))
@@ -724,9 +974,23 @@ class Av1an:
         # Save
         file_name = str(self.d.get('output_file').stem) + '_plot.png'
         plt.savefig(file_name, dpi=500)
+        plt.close()
+
+    def vmaf_threads(self):
+        """Number of concurrent target vmaf probes per worker."""
+        threads = self.d.get('vmaf_threads')
+        if not threads:
+            threads = max(1, (os.cpu_count() or 1) // max(1, self.d.get('workers')))
+        return threads
 
     def target_vmaf(self, source, command):
-        # TODO speed up for vmaf stuff
+        import numpy as np
+        from scipy import interpolate
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        from vmaf_search import CQSearch
+
         try:
             if self.d.get('vmaf_steps') < 4:
                 print('Target vmaf require more than 3 probes/steps')
@@ -736,70 +1000,95 @@ class Av1an:
             mincq = self.d.get('min_cq')
             maxcq = self.d.get('max_cq')
             steps = self.d.get('vmaf_steps')
-            frames = Av1an.frame_probe(source)
+            frames = self.chunk_frames(source)
 
-            # Making 6 fps probing file
-            cq = self.man_cq(command, -1)
             probe = source.with_suffix(".mp4")
-            cmd = f'{self.FFMPEG} -i {source.as_posix()} ' \
-                  f'-r 6 -an -c:v libx264 -crf 0 {source.with_suffix(".mp4")}'
-            self.call_cmd(cmd)
-
-            # Make encoding fork
-            q = np.unique(np.linspace(mincq, maxcq, num=steps, dtype=int, endpoint=True))
 
-            # Encoding probes
+            # Encoding probe and getting vmaf
             single_p = 'aomenc  -q --passes=1 '
             params = "--threads=8 --end-usage=q --cpu-used=6 --cq-level="
-            cmd = [[f'{self.FFMPEG} -i {probe} {self.d.get("ffmpeg_pipe")} {single_p} '
-                    f'{params}{x} -o {probe.with_name(f"v_{x}{probe.stem}")}.ivf - ',
-                    probe, probe.with_name(f'v_{x}{probe.stem}').with_suffix('.ivf'), x] for x in q]
-
-            # Encoding probe and getting vmaf
-            ls = []
-            pr = []
-            for i in cmd:
-                self.call_cmd(i[0])
-
-                v = self.call_vmaf(i[1], i[2], file=True)
-                x, vmafs, mean, perc_1, perc_25, perc_75 = Av1an.read_vmaf_xml(v)
-
-                pr.append(round(mean, 1))
-                ls.append((round(mean, 3), i[3]))
-
-            x = [x[1] for x in ls]
-            y = [float(x[0]) for x in ls]
-
-            # Interpolate data
-            f = interpolate.interp1d(x, y, kind='cubic')
-            xnew = np.linspace(min(x), max(x), max(x) - min(x))
 
-            # Getting value closest to target
-            tl = list(zip(xnew, f(xnew)))
-            tg_cq = min(tl, key=lambda x: abs(x[1] - tg))
+            # CQ predicted from probes of earlier chunks and runs
+            model, features, mode, cq, slope = None, None, 'search', None, None
+            if not self.d.get('no_cq_model'):
+                model = CQModel(state_dir() / 'cq_model.json',
+                                {'probe': single_p + params, 'pipe': self.d.get('ffmpeg_pipe'),
+                                 'model': str(self.d.get('vmaf_path'))})
+                features = self.cq_features(source)
+                mode, cq, slope = model.plan(features, tg, mincq, maxcq)
+
+            if mode != 'predicted':
+                # Making 6 fps probing file
+                cmd = f'{self.FFMPEG} {self.chunk_input(source)} ' \
+                      f'-r 6 -an -c:v libx264 -crf 0 {source.with_suffix(".mp4")}'
+                self.call_cmd(cmd)
+
+            def encode_cq(x):
+                ivf = probe.with_name(f'v_{x}{probe.stem}').with_suffix('.ivf')
+                self.call_cmd(f'{self.FFMPEG} -i {probe} {self.d.get("ffmpeg_pipe")} {single_p} '
+                              f'{params}{x} -o {ivf} - ')
+                return ivf
+
+            def score(ivfs):
+                # All probes of round share one decode of reference
+                return [round(Av1an.read_vmaf(v)[2], 3) for v in self.call_vmaf_multi(probe, ivfs)]
+
+            search = CQSearch(encode_cq, tg, mincq, maxcq, threads=self.vmaf_threads(),
+                              error=self.d.get('vmaf_error'), score=score)
+
+            if mode == 'predicted':
+                tg_cq = (cq, tg)
+                x, y = search.points()
+                xnew, ynew = x, y
+            elif mode == 'confirm':
+                tg_cq = search.confirm(cq, slope, max(self.d.get('vmaf_error'), 0.5))
+                x, y = search.points()
+                xnew, ynew = x, y
+            elif self.d.get('vmaf_search') == 'grid':
+                x, y = search.grid(steps)
+
+                # Interpolate data
+                f = interpolate.interp1d(x, y, kind='cubic')
+                xnew = np.linspace(min(x), max(x), max(x) - min(x))
+                ynew = f(xnew)
+
+                # Getting value closest to target
+                tg_cq = min(zip(xnew, ynew), key=lambda x: abs(x[1] - tg))
+            else:
+                tg_cq = search.adaptive(steps)
+                x, y = search.points()
+                xnew, ynew = x, y
+
+            if model:
+                used = len(search.results)
+                model.add(features, search.results.items())
+                self.log(f'CQ model: {source.name} {mode}, probes: {used}/{steps}, '
+                         f'saved: {max(0, steps - used)}\n')
+                self.event('cq_model', chunk=source.name, mode=mode, cq=int(tg_cq[0]), probes=used,
+                           saved=max(0, steps - used))
 
             # Saving plot of got data
-            # Plot first
-            plt.plot(x, y, 'x', color='tab:blue')
-            plt.plot(xnew, f(xnew), color='tab:blue')
-            plt.plot(tg_cq[0], tg_cq[1], 'o', color='red')
-            [plt.axhline(i, color='grey', linewidth=0.4) for i in range(0, 100)]
-            [plt.axhline(i, color='black', linewidth=0.6) for i in range(0, 100, 5)]
-            [plt.axvline(i, color='grey', linewidth=0.3) for i in range(0, 100)]
-            plt.xlim(mincq, maxcq)
-            lim = [min([int(x[1]) for x in tl if isinstance(x[1], float) and not isnan(x[1])]),
-                   max([int(x[1]) for x in tl if isinstance(x[1], float) and not isnan(x[1])]) + 1]
-            plt.ylim(lim[0], lim[1])
-            plt.ylabel('VMAF')
-            plt.xlabel('CQ')
-            plt.title(f'Chunk: {probe.stem}, Frames: {frames}')
-            plt.tight_layout()
-            temp = self.d.get('temp') / probe.stem
-            plt.savefig(temp, dpi=300)
-            plt.close()
+            valid = [int(i) for i in ynew if not isnan(i)]
+            if valid:
+                # Plot first
+                plt.plot(x, y, 'x', color='tab:blue')
+                plt.plot(xnew, ynew, color='tab:blue')
+                plt.plot(tg_cq[0], tg_cq[1], 'o', color='red')
+                [plt.axhline(i, color='grey', linewidth=0.4) for i in range(0, 100)]
+                [plt.axhline(i, color='black', linewidth=0.6) for i in range(0, 100, 5)]
+                [plt.axvline(i, color='grey', linewidth=0.3) for i in range(0, 100)]
+                plt.xlim(mincq, maxcq)
+                plt.ylim(min(valid), max(valid) + 1)
+                plt.ylabel('VMAF')
+                plt.xlabel('CQ')
+                plt.title(f'Chunk: {probe.stem}, Frames: {frames}')
+                plt.tight_layout()
+                temp = self.d.get('temp') / probe.stem
+                plt.savefig(temp, dpi=300)
+                plt.close()
 
             self.log(f"File: {source.stem}, Fr: {frames}\n"
-                     f"Probes: {pr}"
+                     f"Probes: {[round(i, 1) for i in y]} CQ: {x}\n"
                      f"Target CQ: {round(tg_cq[0])}\n")
             return int(tg_cq[0]), f'Target: CQ {int(tg_cq[0])} Vmaf: {round(float(tg_cq[1]), 2)}\n'
 
@@ -807,9 +1096,45 @@ class Av1an:
             _, _, exc_tb = sys.exc_info()
             print(f'Error in vmaf_target {e} \nAt line {exc_tb.tb_lineno}')
 
+    def make_y4m_cache(self):
+        """Shared y4m cache for two pass encodes, None if disabled."""
+        # rav1e runs single ffmpeg fed command with passes=2, there is no second pass to reuse cache
+        if not self.d.get('y4m_cache') or self.d.get('passes') != 2 or self.d.get('encoder') == 'rav1e':
+            return None
+
+        folder = self.d.get('y4m_cache_dir')
+        if not folder:
+            shm = Path('/dev/shm')
+            folder = shm / f'av1an_{os.getpid()}' if shm.is_dir() else self.d.get('temp') / 'y4m'
+        cache = Y4MCache(folder, self.d.get('y4m_cache'), int(self.d.get('y4m_cache_size') * 2 ** 30))
+        cache.setup()
+        return cache
+
+    def cache_y4m(self, source: Path, command, frames):
+        """Write decoded and filtered source to y4m cache, returns its path and size, or None if it doesn't fit."""
+        cache = y4m_cache.cache
+        if not cache:
+            return None, 0
+
+        info = self.input_stream()
+        size = frames * frame_bytes(info['width'], info['height'], self.d.get('pix_format'))
+        y4m = cache.acquire(source.name, size)
+        if not y4m:
+            return None, 0
+
+        # Same ffmpeg command as first pass, output goes to cache file instead of pipe
+        f = (self.FFMPEG + command.split('|')[0]).split()
+        f[-1] = y4m.as_posix()
+        subprocess.run(f, stdout=PIPE, stderr=STDOUT)
+
+        if not y4m.exists():
+            cache.release(y4m, size)
+            return None, 0
+        actual = y4m.stat().st_size
+        cache.resize(size, actual)
+        return y4m, actual
+
     def encode(self, commands):
-        counter = commands[1]
-        commands = commands[0]
         """Single encoder command queue and logging output."""
         encoder = self.d.get('encoder')
         # Passing encoding params to ffmpeg for encoding.
@@ -817,11 +1142,14 @@ class Av1an:
         try:
             st_time = time.time()
             source, target = Path(commands[-1][0]), Path(commands[-1][1])
-            frame_probe_source = Av1an.frame_probe(source)
+            frame_probe_source = self.chunk_frames(source)
+            metrics = {'chunk': source.name, 'frames': frame_probe_source}
+            self.event('chunk_start', **metrics)
 
             # Target Vmaf Mode
             if self.d.get('vmaf_target'):
                 tg_cq, tg_vf = self.target_vmaf(source, commands[0])
+                metrics['cq'] = tg_cq
 
                 cm1 = self.man_cq(commands[0], tg_cq)
 
@@ -836,9 +1164,10 @@ class Av1an:
 
             # Boost
             if self.d.get('boost'):
-                br = self.get_brightness(source.absolute().as_posix())
+                br = self.get_brightness(source)
 
                 com0, cq = self.boost(commands[0], br)
+                metrics.update(brightness=br, cq=cq)
 
                 if self.d.get('passes') == 2:
                     com1, _ = self.boost(commands[1], br, cq)
@@ -852,72 +1181,75 @@ class Av1an:
 
             self.log(f'Enc:  {source.name}, {frame_probe_source} fr\n{tg_vf}{boost}\n')
 
-            # Queue execution
-            for i in commands[:-1]:
-                f, e = i.split('|')
-                f = self.FFMPEG + f
-                f, e = f.split(), e.split()
+            # Encoder time without target vmaf probes and vmaf scoring, for throughput model
+            pass_time = time.time()
 
-                try:
-                    frame = 0
-
-                    ffmpeg_pipe = subprocess.Popen(f, stdout=PIPE, stderr=STDOUT)
-                    pipe = subprocess.Popen(e, stdin=ffmpeg_pipe.stdout, stdout=PIPE,
-                                            stderr=STDOUT,
-                                            universal_newlines=True)
-                    if encoder == 'aom' or encoder == 'vpx':
-                        while True:
-                            line = pipe.stdout.readline().strip()
-                            if len(line) == 0 and pipe.poll() is not None:
-                                break
-                            if 'Pass 2/2' in line or 'Pass 1/1' in line:
-                                match = re.search(r"frame.*?\/([^ ]+?) ", line)
-                                if match:
-                                    new = int(match.group(1))
-                                    if new > frame:
-                                        counter.update(new - frame)
-                                        frame = new
-                    elif encoder == 'rav1e':
-                        while True:
-                            line = pipe.stdout.readline().strip()
-                            if len(line) == 0 and pipe.poll() is not None:
-                                break
-                            match = re.search(r"encoded.*? ([^ ]+?) ", line)
-                            if match:
-                                new = int(match.group(1))
-                                if new > frame:
-                                    counter.update(new - frame)
-                                    frame = new
-
-                    elif encoder == 'svt_av1':
-                        while True:
-                            line = pipe.stdout.readline().strip()
-                            if len(line) == 0 and pipe.poll() is not None:
-                                break
-                        counter.update(frame_probe_source)
-
-                except Exception as e:
-                    _, _, exc_tb = sys.exc_info()
-                    print(f'Error at encode {e}\nAt line {exc_tb.tb_lineno}')
-
-            self.frame_check(source, target)
-
-            frame_probe = Av1an.frame_probe(target)
+            # Decode and filter source once, when more than one pass reads it from ffmpeg
+            piped = [x for x in commands[:-1] if '|' in x]
+            y4m, y4m_size = self.cache_y4m(source, commands[0], frame_probe_source) if len(piped) > 1 else (None, 0)
+
+            # Queue execution
+            try:
+                for n, i in enumerate(commands[:-1]):
+                    f, e = i.split('|')
+                    f = self.FFMPEG + f
+                    f, e = f.split(), e.split()
+
+                    try:
+                        if y4m:
+                            ffmpeg_pipe = y4m.open('rb')
+                            stdin = ffmpeg_pipe
+                        else:
+                            ffmpeg_pipe = subprocess.Popen(f, stdout=PIPE, stderr=STDOUT)
+                            stdin = ffmpeg_pipe.stdout
+                        pipe = subprocess.Popen(e, stdin=stdin, stdout=PIPE, stderr=STDOUT)
+
+                        # Progress is counted on last pass only
+                        encode_progress.track(pipe, encoder, frame_probe_source, count=n == len(commands) - 2)
+
+                        if y4m:
+                            ffmpeg_pipe.close()
+
+                    except Exception as e:
+                        _, _, exc_tb = sys.exc_info()
+                        print(f'Error at encode {e}\nAt line {exc_tb.tb_lineno}')
+            finally:
+                if y4m:
+                    y4m_cache.cache.release(y4m, y4m_size)
 
             enc_time = round(time.time() - st_time, 2)
+            pass_time = round(time.time() - pass_time, 2)
+
+            verified = self.frame_check(source, target, enc_time)
+
+            # Per chunk vmaf, final report is assembled from these
+            if self.d.get('vmaf') and self.d.get('vmaf_chunks'):
+                chunk_vmaf = self.chunk_vmaf(source, target)
+                metrics['vmaf'] = chunk_vmaf
+                self.log(f'Vmaf: {source.name} {chunk_vmaf}\n')
+
+            frame_probe = self.encoded_frames(target)
 
             self.log(f'Done: {source.name} Fr: {frame_probe}\n'
                      f'Fps: {round(frame_probe / enc_time, 4)} Time: {enc_time} sec.\n\n')
+            self.event('chunk_done', encoded_frames=frame_probe, fps=round(frame_probe / enc_time, 4),
+                       time=enc_time, encode_time=pass_time, **metrics)
+
+            if verified:
+                self.reclaim(source)
+
+            return {'chunk': source.name, 'frames': frame_probe, 'time': enc_time, 'encode_time': pass_time,
+                    'pid': os.getpid(), 'verified': verified}
         except Exception as e:
             _, _, exc_tb = sys.exc_info()
             print(f'Error in encoding loop {e}\nAt line {exc_tb.tb_lineno}')
 
     def concatenate_video(self):
-        """With FFMPEG concatenate encoded segments into final file."""
-        with open(f'{self.d.get("temp") / "concat" }', 'w') as f:
-
-            encode_files = sorted((self.d.get('temp') / 'encode').iterdir())
-            f.writelines(f"file '{file.absolute()}'\n" for file in encode_files)
+        """Append chunks that aren't muxed yet and remux video with audio into final file."""
+        video = self.chunk_muxer().finish()
+        if not video:
+            print('No encoded chunks to concatenate')
+            sys.exit()
 
         # Add the audio file if one was extracted from the input
         audio_file = self.d.get('temp') / "audio.mkv"
@@ -927,129 +1259,278 @@ class Av1an:
             audio = ''
 
         try:
-            cmd = f'{self.FFMPEG} -f concat -safe 0 -i {self.d.get("temp") / "concat"} ' \
-                  f'{audio} -c copy -y "{self.d.get("output_file")}"'
+            cmd = f'{self.FFMPEG} -i {video} {audio} -c copy -y "{self.d.get("output_file")}"'
             concat = self.call_cmd(cmd, capture_output=True)
             if len(concat) > 0:
                 raise Exception
 
             self.log('Concatenated\n')
 
-            # Delete temp folders
-            if not self.d.get('keep'):
-                shutil.rmtree(self.d.get('temp'))
-
         except Exception as e:
             _, _, exc_tb = sys.exc_info()
             print(f'Concatenation failed, FFmpeg error\nAt line: {exc_tb.tb_lineno}\nError:{str(concat)}')
             self.log(f'Concatenation failed, aborting, error: {e}\n')
             sys.exit()
 
-    def encoding_loop(self, commands):
-        """Creating process pool for encoders, creating progress bar."""
-        enc_path = self.d.get('temp') / 'split'
-        done_path = self.d.get('temp') / 'done.json'
+    def governor(self):
+        """Resource governor for encoding pool."""
+        info = self.input_stream()
+        return Governor(state_dir() / 'memory.json', self.d.get('encoder'), info['width'], info['height'],
+                        self.d.get('workers'))
 
-        if self.d.get('resume') and done_path.exists():
-            self.log('Resuming...\n')
+    def chunk_scheduler(self, commands):
+        """Scheduler of encoding queue, longest predicted encode first."""
+        model = ThroughputModel(state_dir() / 'throughput.json', self.d.get('encoder'),
+                                self.d.get('video_params'), self.d.get('passes'))
+        scheduler = ChunkScheduler(model)
+
+        info = self.input_stream()
+        pixels = info['width'] * info['height']
+
+        sources = [Path(x[-1][0]) for x in commands]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            frames = list(executor.map(self.chunk_frames, sources))
+
+        sizes = [self.chunk_size(source, fr) for source, fr in zip(sources, frames)]
 
-            with open(done_path) as f:
-                data = json.load(f)
+        for command, source, fr, size in zip(commands, sources, frames, sizes):
+            scheduler.add(source.name, command, fr, pixels, size)
+        return scheduler
 
-            total = data['total']
-            done = len(data['done'])
-            initial = sum(data['done'].values())
+    def start_journal(self):
+        """Start journal of current input or resume it, returns total frame count and frames already encoded."""
+        journal = self.journal()
 
-            self.log(f'Resumed with {done} encoded clips done\n\n')
+        if self.d.get('resume') and journal.exists():
+            self.log('Resuming...\n')
+
+            total, chunks = journal.compact()
+            done = {k: v for k, v in chunks.items() if v.get('status') == 'done'}
+            initial = sum(v['frames'] for v in done.values())
+            failed = [k for k, v in chunks.items() if v.get('status') == 'failed']
+
+            self.log(f'Resumed with {len(done)} encoded clips done, '
+                     f'{round(sum(v.get("time", 0) for v in done.values()), 1)} sec. spent\n'
+                     f'Retrying failed: {", ".join(failed) if failed else "none"}\n\n')
         else:
             initial = 0
             total = self.frame_probe(self.d.get('input'))
-            d = {'total': total, 'done': {}}
-            with open(done_path, 'w') as f:
-                json.dump(d, f)
+            journal.start(total, self.chunk_names())
 
-        clips = len([x for x in enc_path.iterdir() if x.suffix == ".mkv"])
-        w = min(self.d.get('workers'), clips)
+        return total, initial
+
+    def encoding_loop(self, commands):
+        """Creating process pool for encoders, creating progress bar."""
+        total, initial = self.start_journal()
+        muxer = self.chunk_muxer()
+        muxer.done(*self.journal().done())
 
-        print(f'\rQueue: {clips} Workers: {w} Passes: {self.d.get("passes")}\n'
+        clips = len(self.chunk_names())
+        scheduler = self.chunk_scheduler(commands)
+        w = min(self.d.get('max_workers'), len(scheduler))
+
+        print(f'\rQueue: {clips} Workers: {min(self.d.get("workers"), w)}-{w} Passes: {self.d.get("passes")}\n'
               f'Params: {self.d.get("video_params").strip()}')
 
-        with Pool(w) as pool:
-            manager = Manager()
-            counter = manager.Counter(total, initial)
-            commands = [(x, counter) for x in commands]
-            loop = pool.imap_unordered(self.encode, commands)
-            self.log(f'Started encoding queue with {self.d.get("workers")} workers\n\n')
+        y4m = self.make_y4m_cache()
+        counters = FrameCounters(w * 2)
+
+        with Pool(w, initializer=init_worker, initargs=(counters, y4m, log_writer.queue)) as pool:
+            renderer = Renderer(counters, total, initial).start()
+            results = Queue()
+            governor = self.governor().start()
+            self.log(f'Started encoding queue with {self.d.get("workers")}-{w} workers\n\n')
+            self.event('encode_start', encoder=self.d.get('encoder'), params=self.d.get('video_params'),
+                       passes=self.d.get('passes'), workers=w, chunks=len(scheduler), frames=total, done=initial)
+
+            def submit():
+                _, command = scheduler.pop()
+                pool.apply_async(self.encode, (command,),
+                                 callback=results.put, error_callback=results.put)
+                governor.admitted()
 
             try:
-                for _ in loop:
-                    pass
+                # Keep workers busy with most expensive chunk left, model is refined on every finished chunk
+                running = 0
+                while scheduler or running:
+                    while scheduler and running < w and governor.admit(running):
+                        submit()
+                        running += 1
+
+                    try:
+                        result = results.get(timeout=governor.interval)
+                    except Empty:
+                        continue
+
+                    running -= 1
+                    if isinstance(result, BaseException):
+                        raise result
+                    if result:
+                        scheduler.done(result['chunk'], result['encode_time'])
+                        governor.finished(result['pid'])
+                        if result['verified']:
+                            muxer.done(result['chunk'])
             except Exception as e:
                 _, _, exc_tb = sys.exc_info()
                 print(f'Encoding error: {e}\nAt line {exc_tb.tb_lineno}')
                 sys.exit()
+            finally:
+                governor.stop()
+                renderer.stop()
+                if y4m:
+                    y4m.cleanup()
+
+    def farm_settings(self):
+        """Settings that encoder nodes need to compose and encode chunk commands."""
+        keys = ('encoder', 'passes', 'video_params', 'ffmpeg', 'ffmpeg_pipe', 'pix_format', 'no_check',
+                'boost', 'boost_range', 'boost_limit', 'boost_sample', 'vmaf', 'vmaf_target', 'vmaf_error',
+                'vmaf_steps', 'min_cq', 'max_cq', 'vmaf_search', 'vmaf_threads', 'vmaf_path', 'no_cq_model')
+        settings = {k: self.d.get(k) for k in keys}
+        settings['input'] = Path(self.d.get('input')).name
+        settings['input_stream'] = self.input_stream()
+        return settings
+
+    def farm_master(self, commands):
+        """Serving encoding queue to encoder nodes and collecting encoded chunks."""
+        total, initial = self.start_journal()
+
+        # Chunk scores would stay on nodes, vmaf is calculated for whole video
+        self.d['vmaf_chunks'] = False
+
+        scheduler = self.chunk_scheduler(commands)
+        farm = ChunkFarm(scheduler, self.farm_settings(), self.d.get('temp') / 'split',
+                         self.d.get('temp') / 'encode', self.journal(), log=self.log)
+        # Nodes can run code on master through pickled calls, so only listen on other interfaces when asked
+        host = self.d.get('host')[0] if self.d.get('host') else '127.0.0.1'
+        authkey = self.d.get('authkey') or secrets.token_hex(16)
+        serve(farm, (host, self.d.get('port')), authkey.encode())
+
+        print(f'\rMaster: {host}:{self.d.get("port")} Queue: {len(scheduler)} Passes: {self.d.get("passes")}\n'
+              f'Params: {self.d.get("video_params").strip()}')
+        if not self.d.get('authkey'):
+            print(f'Authkey: {authkey}')
+        self.log(f'Serving encoding queue on port {self.d.get("port")}\n\n')
+        self.event('encode_start', encoder=self.d.get('encoder'), params=self.d.get('video_params'),
+                   passes=self.d.get('passes'), chunks=len(scheduler), frames=total, done=initial, mode='master')
+
+        renderer = Renderer(farm, total, initial).start()
+        try:
+            while not farm.finished():
+                time.sleep(1)
+                farm.reap()
+        finally:
+            renderer.stop()
+
+    def farm_worker(self, farm, node):
+        """Encoding chunks pulled from master one by one, until master queue is done."""
+        split, encode = self.d.get('temp') / 'split', self.d.get('temp') / 'encode'
+        try:
+            while True:
+                task = farm.request(node)
+                if task is None:
+                    if farm.finished():
+                        return
+                    time.sleep(1)
+                    continue
+
+                name, data = task
+                source = split / name
+                source.write_bytes(data)
+                command = self.compose_encoding_queue([source])[0]
+                target = Path(command[-1][1])
+
+                result = self.encode(command)
+                if result and target.exists():
+                    farm.complete(node, name, target.read_bytes(), result['frames'], result['encode_time'])
+                else:
+                    farm.fail(node, name)
+
+                for file in (source, target):
+                    if file.exists():
+                        file.unlink()
+        except (OSError, EOFError) as e:
+            print(f'Lost connection to master: {e}')
+
+    def farm_encoder(self):
+        """Encoder node, pulling chunks from master with one thread per worker."""
+        if not self.d.get('authkey'):
+            print('Encoder node requires --authkey printed by master')
+            sys.exit()
+
+        host = self.d.get('host')[0] if self.d.get('host') else '127.0.0.1'
+        farm = connect((host, self.d.get('port')), self.d.get('authkey').encode())
+        node = node_name()
+
+        self.d.update(farm.config())
+        self.check_executables()
+
+        # Separate temp folder, so several nodes can run on master machine
+        self.d['temp'] = Path(f'{self.d.get("temp")}_{node}')
+        self.setup()
+        self.set_logging()
+        self.determine_resources()
+        w = self.d.get('workers')
+
+        print(f'Encoder node {node} of {host}:{self.d.get("port")} Workers: {w}\n'
+              f'Params: {self.d.get("video_params").strip()}')
+
+        heartbeat = Heartbeat(farm, node).start()
+        try:
+            with ThreadPoolExecutor(max_workers=w) as executor:
+                for _ in range(w):
+                    executor.submit(self.farm_worker, farm, node)
+        finally:
+            heartbeat.stop()
+            log_writer.stop()
+
+        if not self.d.get('keep'):
+            shutil.rmtree(self.d.get('temp'))
 
     def extra_split(self, frames):
-        if len(frames) > 0:
-            f = literal_eval(frames)
-            if len(f) > 1:
-                f = list(f)
-        else:
-            f = []
-        f.append(Av1an.frame_probe(self.d.get('input')))
-        split_distance = self.d.get('extra_split')
-
-        # Get all keyframes of original video
-        keyframes = Av1an.get_keyframes(self.d.get('input'))
-
-        t = f[:]
-        t.insert(0, 0)
-        splits = list(zip(t, f))
-        for i in splits:
-            # Getting distance between splits
-            distance = (i[1] - i[0])
-
-            if distance > split_distance:
-                # Keyframes that between 2 split points
-                candidates = [k for k in keyframes if i[1] > k > i[0]]
-
-                if len(candidates) > 0:
-                    # Getting number of splits that need to be inserted
-                    to_insert = min((i[1] - i[0]) // split_distance, (len(candidates)))
-                    for k in range(0, to_insert):
-                        # Approximation of splits position
-                        aprox_to_place = (((k + 1) * distance) // (to_insert + 1)) + i[0]
-
-                        # Getting keyframe closest to approximated
-                        key = min(candidates, key=lambda x: abs(x - aprox_to_place))
-                        f.append(key)
-        self.log(f'Applying extra splits\nSplit distance: {split_distance}\nNew splits:{len(f)}\n')
-        result = [str(x) for x in sorted(f)]
-        result = ','.join(result)
-        return result
+        """Balance chunk lengths, merging scenes shorter than min_split and splitting longer than extra_split."""
+        cuts = [int(x) for x in frames.split(',') if x] if frames else []
+        total = self.frame_probe(self.d.get('input'))
+        keyframes = ProbeCache(self.d.get('temp') / 'probe').keyframes(self.d.get('input'))
+        self.determine_resources()
+        workers = self.d.get('workers')
+
+        if self.d.get('extra_split') > share(total, workers):
+            self.log(f'Split distance {self.d.get("extra_split")} is over half of worker share '
+                     f'{share(total, workers)}, longest chunks can straggle\n')
+
+        result = balance(cuts, keyframes, total, workers, self.d.get('min_split'), self.d.get('extra_split'))
+
+        lengths = [b - a for a, b in zip([0] + result, result + [total])]
+        self.log(f'Balanced chunks\nSplit distance: {self.d.get("min_split")}-{self.d.get("extra_split")}\n'
+                 f'Chunks: {len(cuts) + 1} -> {len(lengths)} Longest: {max(lengths)} '
+                 f'Predicted makespan: {makespan(lengths, workers)}/{total} fr\n')
+        return ','.join(str(x) for x in result)
 
     def setup_routine(self):
         """
         All pre encoding routine.
         Scene detection, splitting, audio extraction
         """
-        if self.d.get('resume') and (self.d.get('temp') / 'done.json').exists():
+        if self.d.get('resume') and self.journal().exists():
             self.set_logging()
 
         else:
             self.setup()
             self.set_logging()
+            self.split_input()
 
-            # Splitting video and sorting big-first
-            framenums = self.scene_detect(self.d.get('input'))
+    def split_input(self):
+        """Scene detection, splitting and audio extraction of current input."""
+        # Splitting video and sorting big-first
+        framenums = self.scene_detect(self.d.get('input'))
 
-            if self.d.get('extra_split'):
-                framenums = self.extra_split(framenums)
+        if self.d.get('extra_split') or self.d.get('min_split'):
+            framenums = self.extra_split(framenums)
 
-            self.split(self.d.get('input'), framenums)
+        self.split(self.d.get('input'), framenums)
 
-            # Extracting audio
-            self.extract_audio(self.d.get('input'))
+        # Extracting audio
+        self.extract_audio(self.d.get('input'))
 
     def video_encoding(self):
         """Encoding video on local machine."""
@@ -1064,16 +1545,186 @@ class Av1an:
         # Determine resources if workers don't set
         self.determine_resources()
 
-        self.encoding_loop(commands)
+        if self.d.get('mode') == 1:
+            self.farm_master(commands)
+        else:
+            self.encoding_loop(commands)
 
         self.concatenate_video()
 
         self.plot_vmaf()
 
+        self.event('encode_done')
+        log_writer.stop()
+
+        # Delete temp folders
+        if not self.d.get('keep'):
+            shutil.rmtree(self.d.get('temp'))
+
+    def batch_job(self, n, file: Path):
+        """Copy of Av1an for single input of batch, with own temp folder and output file."""
+        job = Av1an()
+        job.d = dict(self.d)
+        job.d.update(input=file, output_file=None, temp=self.d.get('temp') / f'{n:03d}_{file.stem}')
+        job.outputs_filenames()
+        return job
+
+    def batch_prepare(self):
+        """Analysis of batch input, returns its encoding state for dispatcher."""
+        if not (self.d.get('resume') and self.journal().exists()):
+            self.setup()
+            self.split_input()
+
+        files = self.get_video_queue(self.d.get('temp') / 'split')
+        commands = self.compose_encoding_queue(files)
+        total, initial = self.start_journal()
+        muxer = self.chunk_muxer()
+        muxer.done(*self.journal().done())
+        scheduler = self.chunk_scheduler(commands)
+        self.event('encode_start', encoder=self.d.get('encoder'), params=self.d.get('video_params'),
+                   passes=self.d.get('passes'), chunks=len(scheduler), frames=total, done=initial)
+        return {'job': self, 'scheduler': scheduler, 'muxer': muxer, 'running': 0, 'total': total,
+                'initial': initial}
+
+    def batch_finish(self):
+        """Concatenation, vmaf and cleanup of batch input."""
+        self.concatenate_video()
+        self.plot_vmaf()
+        self.event('encode_done')
+
+        if not self.d.get('keep'):
+            shutil.rmtree(self.d.get('temp'))
+        self.log(f'Finished: {self.d.get("input")}\n')
+
+    def batch_encoding(self):
+        """
+        Encoding queue of inputs through single worker pool.
+        Next input is analysed and split, and previous one concatenated, while current one encodes.
+        Chunks of next input fill workers as soon as current one has nothing left to start.
+        """
+        self.d.get('temp').mkdir(parents=True, exist_ok=True)
+        self.set_logging()
+        self.determine_resources()
+        w = self.d.get('max_workers')
+        jobs = [self.batch_job(n, file) for n, file in enumerate(self.d.get('queue'))]
+
+        print(f'\rQueue: {len(jobs)} inputs Workers: {self.d.get("workers")}-{w} Passes: {self.d.get("passes")}\n'
+              f'Params: {self.d.get("video_params").strip()}')
+
+        # Analysis runs at most one input ahead of input being dispatched
+        ready, results = Queue(), Queue()
+        ahead = threading.Semaphore(2)
+
+        def analyse():
+            for job in jobs:
+                ahead.acquire()
+                try:
+                    ready.put(job.batch_prepare())
+                except BaseException as e:
+                    ready.put(e)
+                    return
+
+        threading.Thread(target=analyse, daemon=True).start()
+
+        y4m = self.make_y4m_cache()
+        counters = FrameCounters(w * 2)
+        finisher = ThreadPoolExecutor(max_workers=1)
+        finished = []
+
+        with Pool(w, initializer=init_worker, initargs=(counters, y4m, log_writer.queue)) as pool:
+            renderer = Renderer(counters, 0, 0).start()
+            governor = None
+            active = []
+            waiting = len(jobs)
+            running = 0
+
+            def submit(state):
+                _, command = state['scheduler'].pop()
+                pool.apply_async(state['job'].encode, (command,),
+                                 callback=lambda r: results.put((state, r)),
+                                 error_callback=lambda e: results.put((state, e)))
+                state['running'] += 1
+                governor.admitted()
+                if not state['scheduler']:
+                    # Everything of this input is started, next one can be analysed
+                    ahead.release()
+
+            try:
+                while waiting or active:
+                    # Take analysed inputs, wait for one if there is nothing to encode
+                    while waiting:
+                        try:
+                            state = ready.get(block=not active)
+                        except Empty:
+                            break
+                        if isinstance(state, BaseException):
+                            raise state
+                        waiting -= 1
+                        renderer.extend(state['total'], state['initial'])
+                        if governor is None:
+                            governor = state['job'].governor().start()
+                        if not state['scheduler']:
+                            ahead.release()
+                        active.append(state)
+
+                    for state in [x for x in active if not x['scheduler'] and not x['running']]:
+                        active.remove(state)
+                        finished.append(finisher.submit(state['job'].batch_finish))
+                    # Failed concatenation exits finisher thread only, stop batch from main thread
+                    for future in [x for x in finished if x.done()]:
+                        future.result()
+                    if not active:
+                        continue
+
+                    # Earliest input first, so inputs are finished in order
+                    while running < w and governor.admit(running):
+                        state = next((x for x in active if x['scheduler']), None)
+                        if state is None:
+                            break
+                        submit(state)
+                        running += 1
+
+                    try:
+                        state, result = results.get(timeout=governor.interval)
+                    except Empty:
+                        continue
+
+                    running -= 1
+                    state['running'] -= 1
+                    if isinstance(result, BaseException):
+                        raise result
+                    if result:
+                        state['scheduler'].done(result['chunk'], result['encode_time'])
+                        governor.finished(result['pid'])
+                        if result['verified']:
+                            state['muxer'].done(result['chunk'])
+            except Exception as e:
+                _, _, exc_tb = sys.exc_info()
+                print(f'Encoding error: {e}\nAt line {exc_tb.tb_lineno}')
+                sys.exit()
+            finally:
+                if governor:
+                    governor.stop()
+                renderer.stop()
+                if y4m:
+                    y4m.cleanup()
+
+        # Concatenation of last inputs
+        finisher.shutdown()
+        for future in finished:
+            future.result()
+        log_writer.stop()
+
+        if not self.d.get('keep'):
+            shutil.rmtree(self.d.get('temp'), ignore_errors=True)
+
     def main_queue(self):
         # Video Mode. Encoding on local machine
         tm = time.time()
-        if self.d.get('queue'):
+        if self.d.get('queue') and self.d.get('mode') == 0:
+            self.batch_encoding()
+            print(f'Finished: {round(time.time() - tm, 1)}s')
+        elif self.d.get('queue'):
             for file in self.d.get('queue'):
                 tm = time.time()
                 self.d['input'] = file
@@ -1092,6 +1743,11 @@ class Av1an:
         # Read/Set parameters
         self.config()
 
+        # Encoder node gets input and settings from master, executables are checked after that
+        if self.d.get('mode') == 2:
+            self.farm_encoder()
+            return
+
         # Check all executables
         self.check_executables()
 
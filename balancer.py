@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import heapq
+from bisect import bisect_left, bisect_right
+from math import ceil
+
+
+def makespan(lengths, workers):
+    """Finish time of longest-first schedule of chunk lengths on workers."""
+    loads = [0] * max(1, workers)
+    for length in sorted(lengths, reverse=True):
+        heapq.heapreplace(loads, loads[0] + length)
+    return max(loads)
+
+
+def split_long(start, end, keyframes, max_len, min_len):
+    """Cuts at keyframes inside [start, end), evenly spaced so pieces are at most max_len where keyframes allow."""
+    length = end - start
+    if length <= max_len:
+        return []
+
+    # Keyframes that leave at least min_len on both sides
+    lo = bisect_left(keyframes, start + max(1, min_len))
+    hi = bisect_right(keyframes, end - max(1, min_len))
+    if lo >= hi:
+        return []
+
+    pieces = ceil(length / max_len)
+    cuts = []
+    last = start
+    for k in range(1, pieces):
+        target = start + k * length // pieces
+        n = bisect_left(keyframes, target, lo, hi)
+        near = [x for x in keyframes[max(lo, n - 1):min(hi, n + 1)] if x - last >= max(1, min_len)]
+        if not near:
+            continue
+        cut = min(near, key=lambda x: abs(x - target))
+        cuts.append(cut)
+        last = cut
+        lo = bisect_right(keyframes, cut, lo, hi)
+    return cuts
+
+
+def merge_short(bounds, min_len, max_len):
+    """Merge chunks shorter than min_len into shorter neighbour, keeping merged chunks within max_len if possible."""
+    bounds = list(bounds)
+    i = 1
+    while len(bounds) > 2 and i < len(bounds):
+        length = bounds[i] - bounds[i - 1]
+        if length >= min_len:
+            i += 1
+            continue
+
+        prev = bounds[i - 1] - bounds[i - 2] if i > 1 else None
+        nxt = bounds[i + 1] - bounds[i] if i + 1 < len(bounds) else None
+        fits = [(n, x) for n, x in ((i - 1, prev), (i, nxt)) if x is not None and x + length <= max_len]
+        options = fits or [(n, x) for n, x in ((i - 1, prev), (i, nxt)) if x is not None]
+
+        # Removing bound merges chunks on both its sides
+        remove, _ = min(options, key=lambda x: x[1])
+        del bounds[remove]
+        i = max(1, remove)
+    return bounds
+
+
+def share(total, workers):
+    """Half of fair share of one worker, chunks up to this length leave no long stragglers."""
+    return ceil(total / max(1, workers) / 2)
+
+
+def balance(scenes, keyframes, total, workers, min_len=0, max_len=0):
+    """
+    Chunk plan from detected scene cuts: chunks shorter than `min_len` are merged into neighbours,
+    longer than `max_len` are split at keyframes, 0 disables either. Merged chunks are kept
+    within `max_len`, or within half of fair share of one worker when there is no max length,
+    so merging doesn't make stragglers of longest-first schedule.
+    Returns sorted cut frames, without 0 and total.
+    """
+    if total <= 0:
+        return []
+
+    min_len = max(0, min_len)
+    limit = max(max_len or share(total, workers), 2 * min_len, 1)
+
+    bounds = sorted({0, total, *(x for x in scenes if 0 < x < total)})
+    keyframes = sorted(keyframes) if any(a > b for a, b in zip(keyframes, keyframes[1:])) else keyframes
+
+    split = [0]
+    for start, end in zip(bounds, bounds[1:]):
+        if max_len:
+            split.extend(split_long(start, end, keyframes, limit, min_len))
+        split.append(end)
+
+    if min_len:
+        split = merge_short(split, min_len, limit)
+    return split[1:-1]
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Chunk balancer on synthetic scene lists: planning time and predicted makespan
+against previous extra_split, which only added cuts with linear scan over keyframes.
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from balancer import balance, makespan
+
+
+def old_extra_split(cuts, keyframes, total, split_distance):
+    """Previous Av1an.extra_split algorithm."""
+    f = list(cuts) + [total]
+    t = [0] + f
+    for a, b in zip(t, f[:]):
+        distance = b - a
+        if distance > split_distance:
+            candidates = [k for k in keyframes if b > k > a]
+            if candidates:
+                to_insert = min(distance // split_distance, len(candidates))
+                for k in range(to_insert):
+                    aprox = ((k + 1) * distance) // (to_insert + 1) + a
+                    f.append(min(candidates, key=lambda x: abs(x - aprox)))
+    return sorted(set(x for x in f if 0 < x < total))
+
+
+def scenes(rng, count, mean, long_every):
+    """Scene cuts with many tiny scenes and occasional very long ones."""
+    cuts, pos = [], 0
+    for n in range(count):
+        if long_every and n % long_every == 0:
+            length = int(rng.expovariate(1 / (mean * 20))) + 1
+        else:
+            length = int(rng.expovariate(1 / mean)) + 1
+        pos += length
+        cuts.append(pos)
+    return cuts[:-1], cuts[-1]
+
+
+def report(name, cuts, total, workers, seconds):
+    lengths = [b - a for a, b in zip([0] + cuts, cuts + [total])]
+    span = makespan(lengths, workers)
+    print(f'{name:<14}{seconds * 1000:>10.1f}{len(lengths):>9}{min(lengths):>8}{max(lengths):>8}'
+          f'{sum(1 for x in lengths if x < 24):>8}{span:>12}{span / (total / workers):>9.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scenes', type=int, default=10000)
+    parser.add_argument('--mean', type=int, default=60, help='Mean scene length in frames')
+    parser.add_argument('--long_every', type=int, default=200, help='Every Nth scene is 20x longer')
+    parser.add_argument('--gop', type=int, default=48, help='Keyframe interval')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--min_split', type=int, default=24)
+    parser.add_argument('--max_split', type=int, default=480)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cuts, total = scenes(rng, args.scenes, args.mean, args.long_every)
+    keyframes = sorted(set(range(0, total, args.gop)) | set(cuts))
+    print(f'Scenes: {len(cuts) + 1} Frames: {total} Keyframes: {len(keyframes)} Workers: {args.workers}\n')
+    print(f'{"plan":<14}{"ms":>10}{"chunks":>9}{"min":>8}{"max":>8}{"<24":>8}{"makespan":>12}{"/ideal":>9}')
+
+    report('scenes', cuts, total, args.workers, 0)
+
+    st = time.perf_counter()
+    old = old_extra_split(cuts, keyframes, total, args.max_split)
+    report('extra_split', old, total, args.workers, time.perf_counter() - st)
+
+    st = time.perf_counter()
+    new = balance(cuts, keyframes, total, args.workers, args.min_split, args.max_split)
+    report('balance', new, total, args.workers, time.perf_counter() - st)
+
+
+if __name__ == '__main__':
+    main()
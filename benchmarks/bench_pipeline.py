@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Hermetic end-to-end benchmark of Av1an orchestration.
+Synthetic sources are made with ffmpeg lavfi test sources, encoders are replaced
+by fake_encoder.py shims that print progress and write IVF at controlled speed.
+Every stage of video encoding is timed separately, results are written as json
+and can be compared against previous run with --compare.
+
+Requires ffmpeg/ffprobe (with libx264) and av1an.py python dependencies.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+ENCODERS = {'aom': 'aomenc', 'svt_av1': 'SvtAv1EncApp', 'rav1e': 'rav1e'}
+
+
+def make_shims(folder: Path):
+    """Executables named as real encoders that run fake_encoder.py."""
+    folder.mkdir(parents=True, exist_ok=True)
+    for name in ENCODERS.values():
+        shim = folder / name
+        # Name of the shim is how fake encoder knows what to pretend to be
+        shim.write_text(f'#!/bin/sh\nFAKE_ENCODER={name} exec {sys.executable} '
+                        f'{ROOT / "benchmarks" / "fake_encoder.py"} "$@"\n')
+        shim.chmod(0o755)
+    return folder
+
+
+def make_source(folder: Path, width, height, seconds, fps=24, gop=48):
+    """Test pattern video with scene changes every few seconds and audio track."""
+    src = folder / f'src_{width}x{height}_{seconds}s.mkv'
+    if src.exists():
+        return src
+    # Alternating test sources make hard cuts for scene detection
+    part = max(1, min(4, seconds))
+    sources = ['testsrc2', 'smptebars', 'mandelbrot', 'rgbtestsrc']
+    inputs, chains = [], []
+    count = max(1, seconds // part)
+    for i in range(count):
+        # Duration as input option, not every source filter has duration option
+        inputs += ['-f', 'lavfi', '-t', str(part), '-i', f'{sources[i % len(sources)]}=size={width}x{height}:rate={fps}']
+        chains.append(f'[{i}:v]')
+    inputs += ['-f', 'lavfi', '-i', f'sine=frequency=440:duration={part * count}']
+    cmd = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', *inputs,
+           '-filter_complex', f'{"".join(chains)}concat=n={count}:v=1:a=0,format=yuv420p[v]',
+           '-map', '[v]', '-map', f'{count}:a', '-c:v', 'libx264', '-preset', 'ultrafast',
+           '-g', str(gop), '-c:a', 'aac', src.as_posix()]
+    subprocess.run(cmd, check=True)
+    return src
+
+
+def timed(results, stage, func, *args):
+    st = time.perf_counter()
+    value = func(*args)
+    results[stage] = round(time.perf_counter() - st, 4)
+    return value
+
+
+def run_case(src: Path, encoder, workers, scenes, work: Path):
+    """Run every stage of Av1an.video_encoding for one source, return stage timings."""
+    from av1an import Av1an
+    import log_writer
+
+    temp = work / f'temp_{src.stem}_{encoder}'
+    out = work / f'{src.stem}_{encoder}.mkv'
+    scenes_file = temp.with_suffix('.csv')
+    if scenes_file.exists():
+        scenes_file.unlink()
+    argv = ['av1an.py', '-i', str(src), '--temp', str(temp), '-o', str(out), '-enc', encoder,
+            '-w', str(workers), '--passes', '1', '--scenes', str(scenes_file) if scenes else '0']
+    if encoder == 'svt_av1':
+        argv += ['-v', '--preset 8']
+
+    av = Av1an()
+    sys.argv = argv
+    av.arg_parsing()
+    av.config()
+    av.check_executables()
+    av.process_inputs()
+    av.outputs_filenames()
+
+    r = {}
+    timed(r, 'setup', av.setup)
+    av.set_logging()
+    timed(r, 'probe', av.frame_probe, av.d['input'])
+    framenums = timed(r, 'scene_detect', av.scene_detect, av.d['input'])
+    timed(r, 'split', av.split, av.d['input'], framenums)
+    timed(r, 'audio', av.extract_audio, av.d['input'])
+    files = timed(r, 'queue', av.get_video_queue, temp / 'split')
+    commands = timed(r, 'compose', av.compose_encoding_queue, files)
+    av.determine_resources()
+    timed(r, 'encode', av.encoding_loop, commands)
+    timed(r, 'concat', av.concatenate_video)
+    log_writer.stop()
+
+    frames = av.frame_probe(av.d['input'])
+    fps = float(os.environ.get('FAKE_ENCODER_FPS', 0))
+    r['chunks'] = len(files)
+    r['frames'] = frames
+    if fps:
+        # Time of encoders alone, with perfect packing of chunks onto workers
+        ideal = frames / fps / min(workers, len(files))
+        r['encode_overhead'] = round(r['encode'] - ideal, 4)
+    r['total'] = round(sum(v for k, v in r.items() if k in STAGES), 4)
+
+    shutil.rmtree(temp, ignore_errors=True)
+    out.unlink()
+    return r
+
+
+STAGES = ('setup', 'probe', 'scene_detect', 'split', 'audio', 'queue', 'compose', 'encode', 'concat')
+
+
+def compare(current, previous):
+    print(f'\n{"case":<40}{"stage":<16}{"before":>10}{"after":>10}{"change":>10}')
+    for case, stages in current.items():
+        old = previous.get(case, {})
+        for stage in STAGES + ('encode_overhead', 'total'):
+            if stage in stages and stage in old:
+                a, b = old[stage], stages[stage]
+                change = f'{(b - a) / a * 100:+.1f}%' if a else '-'
+                print(f'{case:<40}{stage:<16}{a:>10.3f}{b:>10.3f}{change:>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['640x360', '1920x1080'], help='Source resolutions')
+    parser.add_argument('--lengths', nargs='+', type=int, default=[20, 120], help='Source lengths in seconds')
+    parser.add_argument('--encoders', nargs='+', default=['aom', 'svt_av1', 'rav1e'], choices=list(ENCODERS))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--fps', type=float, default=240, help='Fake encoder speed, 0 - unlimited')
+    parser.add_argument('--scenes', action='store_true', help='Run scene detection instead of single chunk')
+    parser.add_argument('--work', type=Path, default=None, help='Folder for sources and temp files')
+    parser.add_argument('--output', type=Path, default=Path('bench_pipeline.json'))
+    parser.add_argument('--compare', type=Path, default=None, help='Previous results json')
+    args = parser.parse_args()
+
+    work = args.work or Path(tempfile.mkdtemp(prefix='av1an_bench_'))
+    work.mkdir(parents=True, exist_ok=True)
+
+    # Fake encoders first on path, learned models kept away from real ones
+    os.environ['PATH'] = f'{make_shims(work / "bin")}{os.pathsep}{os.environ["PATH"]}'
+    os.environ['FAKE_ENCODER_FPS'] = str(args.fps)
+    os.environ['AV1AN_STATE'] = str(work / 'state')
+    sys.path.insert(0, str(ROOT))
+    os.chdir(work)
+
+    results = {}
+    for size in args.sizes:
+        width, height = (int(x) for x in size.split('x'))
+        for seconds in args.lengths:
+            src = make_source(work, width, height, seconds)
+            for encoder in args.encoders:
+                case = f'{size}_{seconds}s_{encoder}'
+                print(f'{case}...', flush=True)
+                results[case] = run_case(src, encoder, args.workers, args.scenes, work)
+
+    report = {'meta': {'workers': args.workers, 'fps': args.fps, 'scenes': args.scenes,
+                       'python': sys.version.split()[0], 'cpus': os.cpu_count(), 'time': time.time()},
+              'results': results}
+    output = args.output if args.output.is_absolute() else Path(os.environ.get('PWD', '.')) / args.output
+    with output.open('w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results: {output}')
+
+    if args.compare:
+        with args.compare.open() as f:
+            compare(results, json.load(f)['results'])
+
+    if not args.work:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Scene detection on synthetic test sources: PySceneDetect ContentDetector against
+pyscene (OpenCV) and numpy scoring backends of scenes.py, serial and on all workers.
+Cuts of every backend are compared with PySceneDetect cuts, a cut matches if it's within one frame.
+Last row is cut query from cached scores, as with changed threshold.
+
+Requires ffmpeg/ffprobe (with libx264), opencv-python and scenedetect.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+from bench_pipeline import ROOT, make_source
+
+sys.path.insert(0, str(ROOT))
+
+from probe import count_frames, keyframe_index, stream_info
+from scenes import ScoreCache, frame_scores, cuts_from_scores, downscale_factor, opencv_scores, ffmpeg_scores
+
+
+def pyscenedetect(src: Path, threshold, min_scene_len):
+    """Cuts the way scene_detect found them before scenes.py."""
+    from scenedetect.video_manager import VideoManager
+    from scenedetect.scene_manager import SceneManager
+    from scenedetect.detectors import ContentDetector
+
+    video_manager = VideoManager([str(src)])
+    scene_manager = SceneManager()
+    scene_manager.add_detector(ContentDetector(threshold=threshold, min_scene_len=min_scene_len))
+    video_manager.set_duration()
+    video_manager.set_downscale_factor()
+    video_manager.start()
+    scene_manager.detect_scenes(frame_source=video_manager)
+    scene_list = scene_manager.get_scene_list(video_manager.get_base_timecode())
+    video_manager.release()
+    return [scene[0].get_frames() for scene in scene_list][1:]
+
+
+def matched(cuts, reference):
+    reference = set(reference)
+    return sum(1 for x in cuts if reference & {x - 1, x, x + 1})
+
+
+def report(name, seconds, frames, cuts, reference, base):
+    print(f'{name:<16}{seconds:>10.3f}{frames / seconds:>10.0f}{base / seconds:>9.1f}x'
+          f'{len(cuts):>7}{matched(cuts, reference):>9}/{len(reference)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['1280x720', '1920x1080'])
+    parser.add_argument('--seconds', type=int, default=60, help='Length of test sources')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--threshold', type=float, default=30)
+    parser.add_argument('--min_scene_len', type=int, default=15)
+    args = parser.parse_args()
+
+    work = Path(tempfile.mkdtemp(prefix='av1an_scenes_'))
+    for size in args.sizes:
+        width, height = (int(x) for x in size.split('x'))
+        src = make_source(work, width, height, args.seconds)
+        total, keyframes, stream = count_frames(src), keyframe_index(src), stream_info(src)
+        downscale = downscale_factor(width)
+
+        print(f'\n{size} Frames: {total} Downscale: {downscale} Workers: {args.workers}')
+        print(f'{"detector":<16}{"seconds":>10}{"fps":>10}{"speedup":>10}{"cuts":>7}{"matched":>13}')
+
+        st = time.perf_counter()
+        reference = pyscenedetect(src, args.threshold, args.min_scene_len)
+        base = time.perf_counter() - st
+        report('pyscenedetect', base, total, reference, reference, base)
+
+        methods = {'pyscene': opencv_scores, 'numpy': partial(ffmpeg_scores, stream)}
+        for method, scorer in methods.items():
+            for workers in (1, args.workers):
+                st = time.perf_counter()
+                scores = frame_scores(src, total, keyframes, workers, downscale, scorer=scorer)
+                cuts = cuts_from_scores(scores, args.threshold, args.min_scene_len)
+                report(f'{method} x{workers}', time.perf_counter() - st, total, cuts, reference, base)
+
+        # Cut query from scores cached by numpy backend
+        cache = ScoreCache(work / 'cache', src, {'downscale': downscale, 'method': 'numpy'})
+        frame_scores(src, total, keyframes, args.workers, downscale, cache, scorer=methods['numpy'])
+        st = time.perf_counter()
+        scores = frame_scores(src, total, keyframes, args.workers, downscale, cache, scorer=methods['numpy'])
+        cuts = cuts_from_scores(scores, args.threshold, args.min_scene_len)
+        report('numpy cached', time.perf_counter() - st, total, cuts, reference, base)
+
+    shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
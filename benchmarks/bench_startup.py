@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Startup cost of av1an: import time of av1an module, heavy modules loaded by import,
+time from launch to first encoder process and memory of pool workers.
+Encoders are replaced by fake_encoder.py shims, see bench_pipeline.py.
+
+Requires ffmpeg/ffprobe (with libx264) and psutil.
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import psutil
+
+from bench_pipeline import ROOT, make_shims, make_source
+
+HEAVY = ('numpy', 'scipy', 'matplotlib', 'cv2', 'scenedetect', 'tqdm')
+
+
+def import_time(repeats):
+    """Best cumulative import time of av1an in seconds, from python -X importtime."""
+    best = None
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import av1an'], cwd=ROOT,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE).stderr.decode()
+        match = re.search(r'\|\s*(\d+)\s*\|\s*av1an$', out, re.M)
+        if match:
+            value = int(match.group(1)) / 1e6
+            best = value if best is None else min(best, value)
+    return best
+
+
+def loaded_modules():
+    """Heavy modules that end up loaded just by importing av1an."""
+    code = f'import sys, av1an; print(",".join(m for m in {HEAVY!r} if m in sys.modules))'
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL).stdout.decode().strip()
+    return [x for x in out.split(',') if x]
+
+
+def encode_run(src: Path, work: Path, workers, extra):
+    """Launch av1an, returns time to first encoder start, total time and peak memory of pool workers."""
+    starts = work / 'starts.txt'
+    starts.unlink(missing_ok=True)
+    temp = work / 'temp'
+    cmd = [sys.executable, str(ROOT / 'av1an.py'), '-i', str(src), '--temp', str(temp),
+           '-o', str(work / 'out.mkv'), '-enc', 'aom', '-w', str(workers), '--passes', '1', *extra]
+    env = dict(os.environ, FAKE_ENCODER_STARTS=str(starts))
+
+    launched = time.time()
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    parent = psutil.Process(proc.pid)
+    rss, uss = {}, {}
+    while proc.poll() is None:
+        try:
+            # Pool workers are python children of av1an, encoders and ffmpeg are their children
+            for child in parent.children():
+                if 'python' not in child.name():
+                    continue
+                info = child.memory_full_info()
+                rss[child.pid] = max(rss.get(child.pid, 0), info.rss)
+                uss[child.pid] = max(uss.get(child.pid, 0), info.uss)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+        time.sleep(0.05)
+    total = time.time() - launched
+
+    first = min(float(x) for x in starts.read_text().split()) if starts.exists() else None
+    shutil.rmtree(temp, ignore_errors=True)
+    mib = 2 ** 20
+    return {
+        'first_encode': round(first - launched, 4) if first else None,
+        'total': round(total, 4),
+        'workers': len(rss),
+        'worker_rss_mib': round(max(rss.values()) / mib, 1) if rss else None,
+        'worker_uss_mib': round(max(uss.values()) / mib, 1) if uss else None,
+    }
+
+
+def compare(current, previous):
+    print(f'\n{"metric":<36}{"before":>12}{"after":>12}')
+    for case, values in current.items():
+        if not isinstance(values, dict):
+            continue
+        for key, value in values.items():
+            old = previous.get(case, {}).get(key)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)):
+                print(f'{case + "." + key:<36}{old:>12.3f}{value:>12.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=5, help='Runs of every measurement, best is kept')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=int, default=8, help='Length of test source')
+    parser.add_argument('--output', type=Path, default=Path('bench_startup.json'))
+    parser.add_argument('--compare', type=Path, default=None, help='Previous results json')
+    args = parser.parse_args()
+    output = args.output.absolute()
+
+    work = Path(tempfile.mkdtemp(prefix='av1an_startup_'))
+    os.environ['PATH'] = f'{make_shims(work / "bin")}{os.pathsep}{os.environ["PATH"]}'
+    os.environ['AV1AN_STATE'] = str(work / 'state')
+    src = make_source(work, 640, 360, args.seconds)
+
+    results = {'import': {'seconds': import_time(args.repeats), 'heavy_modules': loaded_modules()}}
+    cases = {'no_scenes': ['--scenes', '0'], 'scenes': ['--scenes', str(work / 'scenes.csv')]}
+    for case, extra in cases.items():
+        runs = []
+        for _ in range(args.repeats):
+            (work / 'scenes.csv').unlink(missing_ok=True)
+            runs.append(encode_run(src, work, args.workers, extra))
+        results[case] = min(runs, key=lambda x: x['first_encode'] or float('inf'))
+        print(case, results[case])
+    print('import', results['import'])
+
+    report = {'meta': {'python': sys.version.split()[0], 'cpus': os.cpu_count(), 'time': time.time()},
+              'results': results}
+    with output.open('w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results: {output}')
+
+    if args.compare:
+        with args.compare.open() as f:
+            compare(results, json.load(f)['results'])
+
+    shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
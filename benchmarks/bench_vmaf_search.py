@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Target vmaf search benchmark.
+Compares probe count, wall time and cq error of serial grid search (old behaviour)
+against adaptive search with different thread budgets, on synthetic cq -> vmaf curves.
+Probe encodes are simulated with sleep.
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vmaf_search import CQSearch  # noqa: E402
+
+
+def curve(cq, slope, mid):
+    """Synthetic cq -> vmaf curve, decreasing logistic."""
+    return 100 / (1 + math.exp((cq - mid) / slope))
+
+
+def true_cq(target, slope, mid, min_cq, max_cq):
+    return min(range(min_cq, max_cq + 1), key=lambda x: abs(curve(x, slope, mid) - target))
+
+
+def run(mode, target, slope, mid, args, threads):
+    probes = []
+
+    def probe(cq):
+        probes.append(cq)
+        time.sleep(args.latency)
+        return round(curve(cq, slope, mid), 3)
+
+    search = CQSearch(probe, target, args.min_cq, args.max_cq, threads=threads, error=args.error)
+    st = time.time()
+    if mode == 'grid':
+        x, y = search.grid(args.steps)
+        # Old code interpolates grid points, linear here to avoid scipy
+        xnew = np.arange(min(x), max(x) + 1)
+        ynew = np.interp(xnew, x, y)
+        cq = int(xnew[np.argmin(np.abs(ynew - target))])
+    else:
+        cq, _ = search.adaptive(args.steps)
+    elapsed = time.time() - st
+
+    return {'mode': mode, 'threads': threads, 'target': target, 'slope': slope, 'mid': mid,
+            'probes': len(probes), 'time': round(elapsed, 4), 'cq': cq,
+            'cq_error': abs(cq - true_cq(target, slope, mid, args.min_cq, args.max_cq))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds per simulated probe')
+    parser.add_argument('--steps', type=int, default=8, help='Grid steps / adaptive probe limit')
+    parser.add_argument('--min_cq', type=int, default=25)
+    parser.add_argument('--max_cq', type=int, default=50)
+    parser.add_argument('--error', type=float, default=0.5, help='Vmaf error for early stop')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--output', type=Path, default=None, help='Write json results')
+    args = parser.parse_args()
+
+    cases = [(t, s, m) for t in (90, 93, 95, 97) for s in (6, 10) for m in (55, 65)]
+    results = [run('grid', *c, args, 1) for c in cases]
+    for threads in args.threads:
+        results += [run('adaptive', *c, args, threads) for c in cases]
+
+    print(f'{"mode":<10}{"threads":>8}{"probes":>10}{"time s":>10}{"cq error":>10}')
+    summary = []
+    for mode, threads in [('grid', 1)] + [('adaptive', t) for t in args.threads]:
+        r = [x for x in results if x['mode'] == mode and x['threads'] == threads]
+        row = {'mode': mode, 'threads': threads,
+               'probes': sum(x['probes'] for x in r) / len(r),
+               'time': sum(x['time'] for x in r) / len(r),
+               'cq_error': sum(x['cq_error'] for x in r) / len(r)}
+        summary.append(row)
+        print(f'{mode:<10}{threads:>8}{row["probes"]:>10.2f}{row["time"]:>10.3f}{row["cq_error"]:>10.2f}')
+
+    if args.output:
+        with args.output.open('w') as f:
+            json.dump({'summary': summary, 'runs': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Stand-in for aomenc, SvtAv1EncApp and rav1e, picked by FAKE_ENCODER or executable name.
+Reads y4m from stdin, prints progress like real encoder and writes IVF with one frame per input frame.
+Frame payload is temporal delimiter and padding OBU, so file is valid IVF but doesn't decode to picture.
+Speed is limited by FAKE_ENCODER_FPS (default: unlimited).
+Start time of every run is appended to FAKE_ENCODER_STARTS file, if set.
+"""
+
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+
+
+def leb128(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        out.append(byte | (0x80 if value else 0))
+        if not value:
+            return bytes(out)
+
+
+def payload(size):
+    """Temporal delimiter OBU followed by padding OBU."""
+    return b'\x12\x00' + b'\x7a' + leb128(size) + bytes(size)
+
+
+def read_y4m(stream):
+    """Yields frames of y4m stream, first value is (width, height, fps)."""
+    header = stream.readline().split()
+    width = height = 0
+    fps = (24, 1)
+    chroma = 1.5
+    depth = 1
+    for token in header[1:]:
+        tag, value = token[:1], token[1:].decode()
+        if tag == b'W':
+            width = int(value)
+        elif tag == b'H':
+            height = int(value)
+        elif tag == b'F':
+            num, den = value.split(':')
+            fps = (int(num), int(den))
+        elif tag == b'C':
+            chroma = 3 if value.startswith('444') else 2 if value.startswith('422') else 1.5
+            depth = 2 if any(x in value for x in ('p10', 'p12', 'p16')) else 1
+    yield width, height, fps
+
+    size = int(width * height * chroma * depth)
+    while True:
+        line = stream.readline()
+        if not line.startswith(b'FRAME'):
+            return
+        if len(stream.read(size)) < size:
+            return
+        yield True
+
+
+def arg(args, *names):
+    """Value of option given as `--name value` or `--name=value`."""
+    for i, a in enumerate(args):
+        for name in names:
+            if a == name and i + 1 < len(args):
+                return args[i + 1]
+            if a.startswith(name + '='):
+                return a.split('=', 1)[1]
+    return None
+
+
+def progress(encoder, frame, fps, args):
+    if encoder == 'aomenc':
+        passes, current = arg(args, '--passes') or '1', arg(args, '--pass') or '1'
+        return f'\rPass {current}/{passes} frame {frame + 1:4d}/{frame:<4d} {frame * 900:7d}B ' \
+               f'{int(frame / max(fps, 1e-3) * 1000):7d} ms {fps:.2f} fps'
+    if encoder == 'rav1e':
+        return f'\rencoded {frame} frames, {fps:.3f} fps, 100.00 Kb/s'
+    return f'\rEncoding frame {frame:4d} 100.00 kbps {fps:.2f} fps'
+
+
+def main():
+    starts = os.environ.get('FAKE_ENCODER_STARTS')
+    if starts:
+        with open(starts, 'a') as f:
+            f.write(f'{time.time()}\n')
+
+    encoder = os.environ.get('FAKE_ENCODER') or Path(sys.argv[0]).name
+    args = sys.argv[1:]
+    output = arg(args, '-o', '--output', '-b')
+    limit = float(os.environ.get('FAKE_ENCODER_FPS', 0))
+
+    frames = read_y4m(sys.stdin.buffer)
+    width, height, (num, den) = next(frames)
+    frame_size = max(64, width * height // 200)
+
+    data = []
+    start = time.time()
+    for n, _ in enumerate(frames, 1):
+        data.append(payload(frame_size))
+        if limit:
+            delay = start + n / limit - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        sys.stderr.write(progress(encoder, n, n / max(time.time() - start, 1e-6), args))
+        sys.stderr.flush()
+    sys.stderr.write('\n')
+
+    # First pass statistics files
+    for stat in (arg(args, '--fpf'), arg(args, '-output-stat-file'), arg(args, '--first-pass')):
+        if stat:
+            Path(stat).write_bytes(struct.pack('<I', len(data)))
+
+    if output and output != os.devnull:
+        with open(output, 'wb') as f:
+            f.write(struct.pack('<4sHH4sHHIIII', b'DKIF', 0, 32, b'AV01', width, height, num, den, len(data), 0))
+            for pts, frame in enumerate(data):
+                f.write(struct.pack('<IQ', len(frame), pts))
+                f.write(frame)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import subprocess
+from subprocess import PIPE, DEVNULL
+from pathlib import Path
+import numpy as np
+
+# Limited range luma 16-235 to full range 0-255, as gray of OpenCV decoded BGR frames
+FULL_RANGE = np.clip(np.round((np.arange(256) - 16) * 255 / 219), 0, 255).astype(np.uint8)
+
+
+def luma_means(source: Path, width, height, sample=1, scale=256, batch=256, args=None):
+    """
+    Mean full range luma of every `sample`th frame.
+    Frames are downscaled to `scale` width gray planes by ffmpeg and read from rawvideo pipe in batches.
+    Gray plane is limited range Y, it's expanded to full range so values match OpenCV BGR to gray.
+    `args` are ffmpeg input arguments used instead of `-i source`, for part of source.
+    """
+    if (width or 0) <= 0 or (height or 0) <= 0:
+        # Size wasn't probed, mean luma doesn't depend on aspect ratio of scaled frame
+        width, height = scale, scale * 9 // 16
+    elif width > scale:
+        height = max(2, round(height * scale / width / 2) * 2)
+        width = scale
+    size = width * height
+
+    select = f'select=not(mod(n\\,{sample})),' if sample > 1 else ''
+    args = args or ['-i', Path(source).absolute().as_posix()]
+    cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error', *args,
+           '-map', '0:v:0', '-vf', f'{select}scale={width}:{height}:flags=area,format=gray',
+           '-vsync', '0', '-f', 'rawvideo', '-pix_fmt', 'gray', '-']
+    pipe = subprocess.Popen(cmd, stdout=PIPE, stderr=DEVNULL)
+
+    means = []
+    while True:
+        data = pipe.stdout.read(size * batch)
+        frames = len(data) // size
+        if frames == 0:
+            break
+        planes = np.frombuffer(data, dtype=np.uint8, count=frames * size).reshape(frames, size)
+        means.append(FULL_RANGE[planes].mean(axis=1))
+    pipe.stdout.close()
+    pipe.wait()
+
+    return np.concatenate(means) if means else np.zeros(0)
+
+
+def geometric_mean(means):
+    """Geometric mean of brightness values shifted by 1, so black frames don't zero it."""
+    if len(means) == 0:
+        return 0.0
+    return round(float(np.exp(np.log(means + 1).mean())), 1)
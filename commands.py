@@ -105,11 +105,8 @@ class FrameCount(Command):
     def makeCommand(self):
         r = f"# FrameCount {self.sources[0]}\n"
         r += super().makeCommand()
-        r += (f"\t{FFMPEG_COMMAND} -v 32 -i $< -an "
-              r"-c:v copy -f null - 2>&1 >/dev/null | tr '\r' '\n' | "
-              "grep -e '^frame=' | "
-              "tail -n 1 | "
-              r'sed -E "s/frame=\s*([0-9]+)\s.*/\1/" > $@')
+        # Frame headers of IVF/Matroska are counted without decoding
+        r += "\t$(containerscript) $< > $@"
         return r
 
 
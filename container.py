@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+
+from journal import Journal
+
+# DKIF signature, version, header size, fourcc, width, height, timebase rate and scale, frame count, unused
+IVF_HEADER = struct.Struct('<4sHH4sHHIII4x')
+# Frame size and pts
+IVF_FRAME = struct.Struct('<IQ')
+EBML_MAGIC = b'\x1a\x45\xdf\xa3'
+
+# Matroska element ids
+MKV_SEGMENT = 0x18538067
+MKV_INFO = 0x1549A966
+MKV_TIMECODE_SCALE = 0x2AD7B1
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_NUMBER = 0xD7
+MKV_TRACK_TYPE = 0x83
+MKV_DEFAULT_DURATION = 0x23E383
+MKV_CLUSTER = 0x1F43B675
+MKV_TIMECODE = 0xE7
+MKV_BLOCK_GROUP = 0xA0
+MKV_BLOCK = 0xA1
+MKV_SIMPLE_BLOCK = 0xA3
+# Masters that are read element by element instead of skipped, they can have unknown size
+MKV_DESCEND = {MKV_SEGMENT, MKV_INFO, MKV_TRACKS, MKV_TRACK_ENTRY, MKV_CLUSTER, MKV_BLOCK_GROUP}
+MKV_UINTS = {MKV_TIMECODE_SCALE, MKV_TRACK_NUMBER, MKV_TRACK_TYPE, MKV_DEFAULT_DURATION, MKV_TIMECODE}
+
+
+def ivf_frames(f):
+    """Yields (pts, data) of every frame of open IVF file positioned after header."""
+    while True:
+        header = f.read(IVF_FRAME.size)
+        if len(header) < IVF_FRAME.size:
+            return
+        size, pts = IVF_FRAME.unpack(header)
+        data = f.read(size)
+        if len(data) < size:
+            return
+        yield pts, data
+
+
+def mapped(path: Path):
+    """Read-only memory map of file, None for empty file."""
+    with Path(path).open('rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def ivf_stats(path: Path):
+    """
+    Frame count, frame sizes and duration in seconds of IVF file, only frame headers are read.
+    Truncated last frame isn't counted.
+    """
+    buf = mapped(path)
+    if buf is None or len(buf) < IVF_HEADER.size:
+        return None
+    with buf:
+        header = IVF_HEADER.unpack_from(buf)
+        if header[0] != b'DKIF':
+            return None
+        rate, scale = header[6], header[7]
+        sizes = array('I')
+        first = last = step = None
+        pos, end = header[2], len(buf)
+        while pos + IVF_FRAME.size <= end:
+            size, pts = IVF_FRAME.unpack_from(buf, pos)
+            pos += IVF_FRAME.size + size
+            if pos > end:
+                break
+            sizes.append(size)
+            if first is None:
+                first = pts
+            elif step is None:
+                step = pts - last
+            last = pts
+
+    ticks = last - first + (step or 1) if sizes else 0
+    return {'frames': len(sizes), 'sizes': sizes, 'duration': ticks * scale / rate if rate else 0.0}
+
+
+def ebml_vint(buf, pos, strip=True):
+    """EBML variable size integer at pos, returns value, its length and if it's all ones (unknown size)."""
+    first = buf[pos]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8:
+        raise ValueError(f'Invalid EBML integer at {pos}')
+    value = int.from_bytes(buf[pos:pos + length], 'big')
+    if strip:
+        value &= (1 << (7 * length)) - 1
+    return value, length, value == (1 << (7 * length)) - 1
+
+
+def mkv_stats(path: Path):
+    """
+    Frame count, frame sizes and duration in seconds of first video track of Matroska file,
+    from block headers of clusters without reading frame data.
+    Frames of laced blocks share block size evenly.
+    """
+    buf = mapped(path)
+    if buf is None or buf[:4] != EBML_MAGIC:
+        return None
+    with buf:
+        scale = 1000000
+        tracks, entry, video = {}, {}, None
+        cluster = 0
+        blocks = []
+        pos, end = 0, len(buf)
+        while pos < end:
+            try:
+                eid, id_len, _ = ebml_vint(buf, pos, strip=False)
+                size, size_len, unknown = ebml_vint(buf, pos + id_len)
+            except (ValueError, IndexError):
+                break
+            pos += id_len + size_len
+
+            if eid in MKV_DESCEND:
+                if eid == MKV_TRACK_ENTRY:
+                    entry = {}
+                continue
+            if unknown or pos + size > end:
+                break
+
+            if eid in MKV_UINTS:
+                value = int.from_bytes(buf[pos:pos + size], 'big')
+                if eid == MKV_TIMECODE_SCALE:
+                    scale = value
+                elif eid == MKV_TIMECODE:
+                    cluster = value
+                else:
+                    entry[eid] = value
+                    if MKV_TRACK_NUMBER in entry and MKV_TRACK_TYPE in entry:
+                        tracks[entry[MKV_TRACK_NUMBER]] = entry
+                        if video is None and entry[MKV_TRACK_TYPE] == 1:
+                            video = entry[MKV_TRACK_NUMBER]
+            elif eid in (MKV_SIMPLE_BLOCK, MKV_BLOCK):
+                track, track_len, _ = ebml_vint(buf, pos)
+                head = pos + track_len
+                timecode, flags = struct.unpack_from('>hB', buf, head)
+                # Laced block starts with number of frames minus one
+                count = buf[head + 3] + 1 if flags & 0x06 else 1
+                blocks.append((track, cluster + timecode, count, size - track_len - 3))
+            pos += size
+
+    blocks = [x for x in blocks if x[0] == video]
+    if not blocks:
+        return {'frames': 0, 'sizes': array('I'), 'duration': 0.0}
+
+    sizes = array('I')
+    for _, _, count, size in blocks:
+        sizes.extend([size // count] * count)
+    stamps = sorted(x[1] for x in blocks)
+    step = tracks[video].get(MKV_DEFAULT_DURATION)
+    if step is None:
+        # Average frame interval when track has no default duration
+        step = (stamps[-1] - stamps[0]) * scale / max(1, len(sizes) - 1)
+    return {'frames': len(sizes), 'sizes': sizes, 'duration': ((stamps[-1] - stamps[0]) * scale + step) / 1e9}
+
+
+def container_stats(path: Path):
+    """Stats of IVF or Matroska file without decoding, None for other containers or unreadable file."""
+    try:
+        with Path(path).open('rb') as f:
+            magic = f.read(4)
+        if magic == b'DKIF':
+            return ivf_stats(path)
+        if magic == EBML_MAGIC:
+            return mkv_stats(path)
+    except (OSError, ValueError, struct.error):
+        pass
+    return None
+
+
+def frame_count(path: Path):
+    """Frame count from container, None if it can't be read natively."""
+    stats = container_stats(path)
+    return stats['frames'] if stats else None
+
+
+class ChunkMuxer:
+    """
+    Appends encoded chunks to single IVF file in chunk order, as soon as every chunk before them is done.
+    Frame pts are shifted to continue previous chunk and frame count in header is kept up to date.
+    Output size, frame count and next pts after every chunk are recorded in journal,
+    so resumed encode truncates output to last recorded chunk and continues from there.
+    """
+
+    def __init__(self, output: Path, journal: Journal, encode: Path, keep=False):
+        self.output = Path(output)
+        self.journal = journal
+        self.encode = Path(encode)
+        self.keep = keep
+        self.order = journal.order()
+        self.ready = set()
+        self.position, self.offset, self.frames, self.pts = 0, 0, 0, 0
+
+        last = journal.muxed()
+        size = self.output.stat().st_size if self.output.exists() else 0
+        if last and last['muxed'] in self.order and size >= last['offset']:
+            self.position = self.order.index(last['muxed']) + 1
+            self.offset, self.frames, self.pts = last['offset'], last['frames'], last['pts']
+            if size > self.offset:
+                # Interrupted append
+                with self.output.open('r+b') as f:
+                    f.truncate(self.offset)
+        elif self.output.exists():
+            self.output.unlink()
+
+    def pending(self):
+        return self.order[self.position:]
+
+    def done(self, *names):
+        """Mark verified chunks, appending every chunk that completes prefix."""
+        self.ready.update(names)
+        while self.position < len(self.order) and self.order[self.position] in self.ready:
+            self.append(self.order[self.position])
+            self.position += 1
+
+    def finish(self):
+        """Append all remaining encoded chunks, returns output path or None if nothing was muxed."""
+        missing = []
+        for name in self.pending():
+            if self.chunk(name).exists():
+                self.append(name)
+            else:
+                missing.append(name)
+            self.position += 1
+
+        if missing:
+            print(f'Missing encoded chunks: {", ".join(missing)}')
+        return self.output if self.frames else None
+
+    def chunk(self, name):
+        return self.encode / Path(name).with_suffix('.ivf').name
+
+    def append(self, name):
+        ivf = self.chunk(name)
+        with ivf.open('rb') as src, self.output.open('r+b' if self.offset else 'wb') as out:
+            header = IVF_HEADER.unpack(src.read(IVF_HEADER.size))
+            src.seek(header[2])
+            if not self.offset:
+                out.write(IVF_HEADER.pack(*header[:8], 0))
+                self.offset = IVF_HEADER.size
+            out.seek(self.offset)
+
+            first = last = step = None
+            for pts, data in ivf_frames(src):
+                if first is None:
+                    first = pts
+                elif step is None:
+                    step = pts - last
+                last = pts
+                out.write(IVF_FRAME.pack(len(data), self.pts + pts - first))
+                out.write(data)
+                self.frames += 1
+
+            if first is not None:
+                self.pts += last - first + (step or 1)
+            self.offset = out.tell()
+
+            # Frame count in header
+            out.seek(24)
+            out.write(struct.pack('<I', self.frames))
+            out.flush()
+            os.fsync(out.fileno())
+
+        self.journal.append({'muxed': name, 'offset': self.offset, 'frames': self.frames, 'pts': self.pts})
+        if not self.keep:
+            ivf.unlink()
+
+
+if __name__ == '__main__':
+    # Frame count of file for make rules, probing with ffmpeg when container isn't IVF or Matroska
+    frames = frame_count(Path(sys.argv[1]))
+    if frames is None:
+        from probe import count_frames
+        frames = count_frames(Path(sys.argv[1]))
+    print(frames)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import random
+from math import log, sqrt
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Ridge penalty of all weights except intercept
+RIDGE = 1e-6
+# Error of predictions in CQ steps, measured on chunks probed after prediction, under which
+# predicted CQ is used without probes, once model has TRUST_PROBES probes and TRUST_CHECKS checked predictions
+TRUST_CQ = 0.5
+TRUST_PROBES = 40
+TRUST_CHECKS = 20
+# Share of trusted predictions that are still confirmed by probes, so prediction error keeps being measured
+CHECK_RATE = 0.2
+# Residual error in CQ steps under which predicted CQ is confirmed by probes instead of full search
+CONFIRM_CQ = 3.0
+
+
+class CQModel:
+    """
+    VMAF of probe encode as linear function of CQ and chunk features, fitted by ridge least squares
+    over every target vmaf probe: intercept, cq, log frames, log bpp, brightness, motion and cq * log bpp.
+    CQ for target vmaf of new chunk is solved from fitted line. Probes are confirmed when residual error
+    of fit is small, and skipped only when predictions of model matched probes of later chunks.
+    Fit sums are kept in json file, so probes of past runs and of other workers carry over.
+    """
+
+    def __init__(self, path: Path, settings):
+        self.path = Path(path)
+        self.key = hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+        self.sums = self.empty()
+        self.reload()
+
+    @staticmethod
+    def empty():
+        size = 7
+        return {'n': 0, 'xx': [[0.0] * size for _ in range(size)], 'xy': [0.0] * size, 'yy': 0.0,
+                'motion': 0.0, 'motion_n': 0, 'checks': 0, 'check_sse': 0.0}
+
+    def load(self):
+        try:
+            with self.path.open() as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def reload(self):
+        """Pick up probes saved by other workers."""
+        self.sums = {**self.empty(), **self.load().get(self.key, self.sums)}
+
+    def vector(self, features, cq):
+        s = self.sums
+        motion = features.get('motion')
+        if motion is None:
+            # Mean of seen chunks when scene scores aren't available
+            motion = s['motion'] / s['motion_n'] if s['motion_n'] else 0.0
+        log_bpp = log(max(features['bpp'], 1e-6))
+        return [1.0, cq, log(max(features['frames'], 1)), log_bpp, features['brightness'] / 255,
+                motion / 255, cq * log_bpp]
+
+    def add(self, features, points):
+        """
+        Add probed (cq, vmaf) points of chunk and store sums, merged with what other workers stored.
+        Points are first checked against prediction of model without them.
+        """
+        points = [(cq, vmaf) for cq, vmaf in points if vmaf and vmaf > 0]
+        if not points:
+            return
+
+        lock = os.open(self.path.with_suffix('.lock'), os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            self.store(features, points)
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            os.close(lock)
+
+    def store(self, features, points):
+        """Merge points into stored sums, called under lock."""
+        data = self.load()
+        s = {**self.empty(), **data.get(self.key, {})}
+        self.sums = s
+        self.check(features, points)
+        for cq, vmaf in points:
+            x = self.vector(features, cq)
+            s['n'] += 1
+            s['yy'] += vmaf * vmaf
+            for i, xi in enumerate(x):
+                s['xy'][i] += xi * vmaf
+                for j, xj in enumerate(x):
+                    s['xx'][i][j] += xi * xj
+        if features.get('motion') is not None:
+            s['motion'] += features['motion']
+            s['motion_n'] += 1
+
+        data[self.key] = s
+        tmp = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        with tmp.open('w') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def check(self, features, points):
+        """Add error of predicted vmaf of points, in CQ steps, to prediction error of model."""
+        fit = self.fit()
+        if fit is None:
+            return
+        w = fit[0]
+        for cq, vmaf in points:
+            x = self.vector(features, cq)
+            slope = w[1] + w[6] * x[3]
+            if slope >= -0.05:
+                return
+            error = (float(w @ x) - vmaf) / slope
+            self.sums['checks'] += 1
+            self.sums['check_sse'] += error * error
+
+    def fit(self):
+        """Weights and residual error of fit, None until there are enough probes."""
+        import numpy as np
+        s = self.sums
+        size = len(s['xy'])
+        if s['n'] <= size:
+            return None
+        xx, xy = np.array(s['xx']), np.array(s['xy'])
+        penalty = np.eye(size) * RIDGE * s['n']
+        penalty[0, 0] = 0
+        try:
+            w = np.linalg.solve(xx + penalty, xy)
+        except np.linalg.LinAlgError:
+            return None
+        sse = s['yy'] - 2 * w @ xy + w @ xx @ w
+        return w, sqrt(max(0.0, sse) / (s['n'] - size))
+
+    def predict(self, features, target, min_cq, max_cq):
+        """Predicted CQ for target vmaf, vmaf slope per CQ and residual error, None if model can't say."""
+        fit = self.fit()
+        if fit is None:
+            return None
+        w, error = fit
+        base = self.vector(features, 0)
+        slope = w[1] + w[6] * base[3]
+        if slope >= -0.05:
+            # VMAF has to fall with rising CQ, anything else is bad fit for this chunk
+            return None
+        intercept = sum(float(a) * b for a, b in zip(w, base))
+        cq = int(round(min(max((target - intercept) / slope, min_cq), max_cq)))
+        return cq, float(slope), error
+
+    def plan(self, features, target, min_cq, max_cq):
+        """
+        How to get CQ of chunk: 'predicted' CQ is used as is, 'confirm' is checked by one or two probes,
+        'search' runs full probe search. Returns mode, predicted CQ and vmaf slope per CQ.
+        """
+        predicted = self.predict(features, target, min_cq, max_cq)
+        if predicted is None:
+            return 'search', None, None
+        cq, slope, error = predicted
+        # Vmaf error as CQ error, one CQ step changes vmaf by slope
+        error = error / -slope
+        s = self.sums
+        checked = sqrt(s['check_sse'] / s['checks']) if s['checks'] >= TRUST_CHECKS else None
+        if (checked is not None and max(error, checked) <= TRUST_CQ and s['n'] >= TRUST_PROBES
+                and random.random() >= CHECK_RATE):
+            return 'predicted', cq, slope
+        if error <= CONFIRM_CQ:
+            return 'confirm', cq, slope
+        return 'search', None, None
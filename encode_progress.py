@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import threading
+import multiprocessing
+
+# Encoded frame count in progress output of every encoder
+PATTERNS = {
+    'aom': re.compile(rb'Pass (?:2/2|1/1) .*?frame\s*\d+/(\d+)'),
+    'vpx': re.compile(rb'Pass (?:2/2|1/1) .*?frame\s*\d+/(\d+)'),
+    'rav1e': re.compile(rb'encoded (\d+) frames'),
+    'svt_av1': re.compile(rb'Encoding frame\s*(\d+)'),
+}
+
+# Progress updates are overwritten in place with \r or \b
+SEPARATORS = re.compile(rb'[\r\n\b]')
+
+# Set in pool workers by init_worker
+counters = None
+slot = 0
+
+
+class FrameCounters:
+    """Frame counters in shared memory, every pool worker adds to its own slot, parent sums them."""
+
+    def __init__(self, slots):
+        self.frames = multiprocessing.Array('q', slots, lock=False)
+        self.next_slot = multiprocessing.Value('i', 0)
+
+    def total(self):
+        return sum(self.frames)
+
+
+def init_worker(frame_counters):
+    global counters, slot
+    counters = frame_counters
+    with counters.next_slot.get_lock():
+        # Replaced workers wrap around
+        slot = counters.next_slot.value % len(counters.frames)
+        counters.next_slot.value += 1
+
+
+def add_frames(frames):
+    if counters is not None:
+        counters.frames[slot] += frames
+
+
+class OutputParser:
+    """Parser of raw encoder output, returns last encoded frame count found in fed bytes."""
+
+    def __init__(self, encoder):
+        self.pattern = PATTERNS[encoder]
+        self.tail = b''
+
+    def feed(self, data):
+        parts = SEPARATORS.split(self.tail + data)
+        # Last part can be cut mid update
+        self.tail = parts.pop()
+        frame = None
+        for part in parts:
+            match = self.pattern.search(part)
+            if match:
+                frame = int(match.group(1))
+        return frame
+
+
+def track(pipe, encoder, frames, count=True):
+    """
+    Read encoder output as soon as any bytes are available and add encoded frames to counter.
+    Returns encoded frame count, counter is topped up to `frames` if encoder finished fine.
+    """
+    parser = OutputParser(encoder)
+    fd = pipe.stdout.fileno()
+    done = 0
+    while True:
+        data = os.read(fd, 65536)
+        if not data:
+            break
+        if count:
+            new = parser.feed(data)
+            if new is not None:
+                new = min(new, frames)
+                if new > done:
+                    add_frames(new - done)
+                    done = new
+    pipe.wait()
+
+    if count and pipe.returncode == 0 and done < frames:
+        add_frames(frames - done)
+        done = frames
+    return done
+
+
+class Renderer:
+    """Single progress bar in parent process, redrawn from shared counters at most every `interval` seconds."""
+
+    def __init__(self, counters: FrameCounters, total, initial, interval=0.25):
+        from tqdm import tqdm
+
+        self.counters = counters
+        self.interval = interval
+        self.shown = 0
+        self.bar = tqdm(total=total, initial=initial, dynamic_ncols=True, unit="fr", leave=True, smoothing=0.01)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def extend(self, total, initial=0):
+        """Add frames of another input to progress bar."""
+        self.bar.total += total
+        self.bar.update(initial)
+
+    def refresh(self):
+        done = self.counters.total()
+        if done > self.shown:
+            self.bar.update(done - self.shown)
+            self.shown = done
+
+    def loop(self):
+        while not self.stopped.wait(self.interval):
+            self.refresh()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.refresh()
+        self.bar.close()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+import os
+import socket
+import threading
+import time
+from multiprocessing.managers import BaseManager
+from pathlib import Path
+
+from journal import Journal
+from scheduler import ChunkScheduler
+
+
+class FarmManager(BaseManager):
+    pass
+
+
+class ChunkFarm:
+    """
+    Encoding queue of master, served to encoder nodes over TCP.
+    Nodes pull chunks with request, report liveness with heartbeat and return encoded IVF with complete.
+    Chunks of nodes that are silent for `timeout` seconds go back to queue.
+    When queue is empty, idle node gets duplicate of chunk with longest predicted time left,
+    first verified copy wins.
+    """
+
+    def __init__(self, scheduler: ChunkScheduler, settings, split: Path, encode: Path, journal: Journal,
+                 log=print, timeout=30):
+        self.scheduler = scheduler
+        self.settings = settings
+        self.split = Path(split)
+        self.encode = Path(encode)
+        self.journal = journal
+        self.log = log
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.chunks = len(scheduler)
+        self.items = {}
+        self.nodes = {}
+        self.running = {}
+        self.done = {}
+        self.frames = 0
+
+    def config(self):
+        """Encoding settings for nodes."""
+        return self.settings
+
+    def total(self):
+        """Frames encoded so far, for progress bar."""
+        return self.frames
+
+    def finished(self):
+        return len(self.done) >= self.chunks
+
+    def heartbeat(self, node):
+        with self.lock:
+            self.nodes[node] = time.time()
+
+    def request(self, node):
+        """Next chunk name and its split source for node, None if there is nothing to do now."""
+        with self.lock:
+            self.nodes[node] = time.time()
+            if self.scheduler:
+                name, item = self.scheduler.pop()
+                self.items[name] = item
+            else:
+                name = self.steal(node)
+                if name is None:
+                    return None
+                self.log(f'Duplicating {name} on {node}\n')
+            self.running.setdefault(name, {})[node] = time.time()
+        return name, (self.split / name).read_bytes()
+
+    def steal(self, node):
+        """Chunk with longest predicted time left that isn't already duplicated."""
+        now = time.time()
+        candidates = {name: self.scheduler.cost(name) - (now - min(starts.values()))
+                      for name, starts in self.running.items()
+                      if name not in self.done and len(starts) == 1 and node not in starts}
+        if not candidates:
+            return None
+        return max(candidates, key=candidates.get)
+
+    def complete(self, node, name, data, frames, seconds):
+        """Encoded chunk from node, False if it isn't used."""
+        with self.lock:
+            self.nodes[node] = time.time()
+            starts = self.running.get(name, {})
+            starts.pop(node, None)
+            if name in self.done:
+                return False
+
+            expected = self.scheduler.features[name][0]
+            if frames != expected:
+                self.journal.chunk(name, 'failed', frames=expected, encoded=frames, node=node)
+                self.log(f'Frame Count Differ for Source {name} from {node}: {frames}/{expected}\n')
+                self.release(name)
+                return False
+
+            target = (self.encode / name).with_suffix('.ivf')
+            tmp = target.with_suffix('.part')
+            tmp.write_bytes(data)
+            os.replace(tmp, target)
+
+            self.done[name] = frames
+            self.frames += frames
+            self.running.pop(name, None)
+            self.journal.chunk(name, 'done', frames=frames, time=seconds, node=node)
+            self.scheduler.done(name, seconds)
+            self.log(f'Done: {name} Fr: {frames} Node: {node} Time: {seconds} sec.\n')
+            return True
+
+    def fail(self, node, name):
+        """Node couldn't encode chunk."""
+        with self.lock:
+            self.running.get(name, {}).pop(node, None)
+            self.log(f'Failed: {name} on {node}\n')
+            self.release(name)
+
+    def release(self, name):
+        """Queue chunk again if no node is working on it."""
+        if name not in self.done and not self.running.get(name):
+            self.running.pop(name, None)
+            self.scheduler.requeue(name, self.items[name])
+
+    def reap(self):
+        """Drop nodes silent for longer than timeout, returns their names."""
+        with self.lock:
+            now = time.time()
+            dead = [node for node, seen in self.nodes.items() if now - seen > self.timeout]
+            for node in dead:
+                del self.nodes[node]
+                for name in [name for name, starts in self.running.items() if node in starts]:
+                    del self.running[name][node]
+                    self.release(name)
+                self.log(f'Node lost: {node}\n')
+            return dead
+
+
+class Heartbeat:
+    """Thread of encoder node reporting it's alive while chunks are encoded."""
+
+    def __init__(self, farm, node, interval=5):
+        self.farm = farm
+        self.node = node
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def loop(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.farm.heartbeat(self.node)
+            except (OSError, EOFError):
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+def node_name():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def serve(farm: ChunkFarm, address, authkey):
+    """Serve farm from thread of master process, so it shares scheduler and journal with master."""
+    FarmManager.register('farm', callable=lambda: farm)
+    server = FarmManager(address=address, authkey=authkey).get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def connect(address, authkey, retries=30):
+    """Proxy of master farm, waits for master to come up."""
+    FarmManager.register('farm')
+    manager = FarmManager(address=address, authkey=authkey)
+    for i in range(retries):
+        try:
+            manager.connect()
+            break
+        except ConnectionRefusedError:
+            if i == retries - 1:
+                raise
+            time.sleep(1)
+    return manager.farm()
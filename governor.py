@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+import psutil
+
+# Memory per chunk in GiB at 1080p, used until real peak is observed
+DEFAULT_PEAK = {'aom': 1.5, 'vpx': 1.5, 'rav1e': 1.5, 'svt_av1': 5}
+
+
+class Governor:
+    """
+    Admission control for encoding pool.
+    Background thread samples cpu utilisation, available memory and rss of every worker process tree.
+    New chunk is started only when there is memory for its expected peak, and either fewer than
+    `base` chunks are running or cpu still has headroom.
+    Observed peak memory per encoder and resolution is kept in json file for future runs.
+    """
+
+    def __init__(self, path: Path, encoder, width, height, base, interval=0.5, cpu_limit=90, ramp=3):
+        self.path = Path(path)
+        self.key = f'{encoder}:{width}x{height}'
+        self.base = max(1, base)
+        self.interval = interval
+        self.cpu_limit = cpu_limit
+        self.ramp = ramp
+
+        gib = 2 ** 30
+        default = DEFAULT_PEAK.get(encoder, 1.5) * gib * max(1, width * height / (1920 * 1080))
+        self.expected = self.load().get(self.key, default)
+        self.reserve = min(gib, psutil.virtual_memory().total * 0.05)
+
+        self.me = psutil.Process()
+        self.peaks = {}
+        self.run_peak = 0
+        self.cpu = 0.0
+        self.available = psutil.virtual_memory().available
+        self.last_admit = 0.0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+
+    def load(self):
+        try:
+            with self.path.open() as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        if not self.run_peak:
+            return
+        data = self.load()
+        data[self.key] = self.run_peak
+        tmp = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        with tmp.open('w') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def start(self):
+        psutil.cpu_percent(None)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.save()
+
+    @staticmethod
+    def tree_rss(proc):
+        rss = 0
+        for p in [proc] + proc.children(recursive=True):
+            try:
+                rss += p.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss
+
+    def sample(self):
+        """Peak rss of every worker process tree since its last finished chunk."""
+        rss = {}
+        for child in self.me.children():
+            try:
+                rss[child.pid] = self.tree_rss(child)
+            except psutil.Error:
+                continue
+        with self.lock:
+            self.cpu = psutil.cpu_percent(None)
+            self.available = psutil.virtual_memory().available
+            for pid, value in rss.items():
+                self.peaks[pid] = max(self.peaks.get(pid, 0), value)
+
+    def loop(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def admit(self, running):
+        """Is there room for one more chunk."""
+        if running == 0:
+            return True
+        with self.lock:
+            if self.available - self.expected < self.reserve:
+                return False
+            if running < self.base:
+                return True
+            # Over base count, grow only on idle cpu and after previous chunk had time to ramp up
+            if self.cpu >= self.cpu_limit or time.time() - self.last_admit < self.ramp:
+                return False
+        return True
+
+    def admitted(self):
+        with self.lock:
+            self.last_admit = time.time()
+            # Memory of new chunk is not allocated yet
+            self.available -= self.expected
+
+    def finished(self, pid):
+        """Worker finished chunk, its peak becomes observation of chunk peak."""
+        with self.lock:
+            peak = self.peaks.pop(pid, 0)
+            if peak:
+                self.run_peak = max(self.run_peak, peak)
+                self.expected = self.run_peak
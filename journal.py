@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class Journal:
+    """
+    Append-only encoding progress journal, one json record per line.
+    Every record is a single locked O_APPEND write followed by fsync,
+    so pool workers can write concurrently without losing each other's records.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def exists(self):
+        return self.path.exists()
+
+    def append(self, record: dict):
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def records(self):
+        """All complete records, broken line from interrupted write is skipped."""
+        if not self.path.exists():
+            return []
+        records = []
+        with self.path.open('rb') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records
+
+    def state(self):
+        """Fold records into total frame count and last status of every chunk."""
+        total, chunks = 0, {}
+        for record in self.records():
+            if 'total' in record:
+                total = record['total']
+            if 'chunk' in record:
+                chunks.setdefault(record['chunk'], {}).update(record)
+        return total, chunks
+
+    def done(self):
+        """Frame counts of finished chunks."""
+        _, chunks = self.state()
+        return {k: v['frames'] for k, v in chunks.items() if v.get('status') == 'done'}
+
+    def order(self):
+        """Chunk names in output order, as recorded on start."""
+        order = []
+        for record in self.records():
+            if 'total' in record:
+                order = record.get('order', [])
+        return order
+
+    def muxed(self):
+        """Last chunk appended to output with output state after it, None if nothing is muxed yet."""
+        last = None
+        for record in self.records():
+            if 'muxed' in record:
+                last = record
+            elif 'total' in record:
+                last = None
+        return last
+
+    def start(self, total, order=()):
+        """Start new journal for encode of total frames split into chunks of given order."""
+        if self.path.exists():
+            self.path.unlink()
+        self.append({'total': total, 'order': list(order)})
+
+    def chunk(self, name, status, **info):
+        self.append({'chunk': name, 'status': status, 'ts': round(time.time(), 3), **info})
+
+    def compact(self):
+        """Rewrite journal as one record per chunk and last muxed record, done on resume."""
+        total, chunks = self.state()
+        order, muxed = self.order(), self.muxed()
+        tmp = self.path.with_suffix('.tmp')
+        with tmp.open('w') as f:
+            f.write(json.dumps({'total': total, 'order': order}, separators=(',', ':')) + '\n')
+            for record in chunks.values():
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+            if muxed:
+                f.write(json.dumps(muxed, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        return total, chunks
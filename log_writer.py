@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import atexit
+import json
+import multiprocessing
+import threading
+import time
+from pathlib import Path
+from queue import Empty
+
+# Queue of running writer, set in parent by LogWriter.start and in pool workers by init_worker
+queue = None
+writer = None
+
+
+def init_worker(log_queue):
+    global queue
+    queue = log_queue
+
+
+def stop():
+    """Stop writer running in this process."""
+    if writer is not None:
+        writer.stop()
+
+
+def write(text):
+    """Send text to log writer, False if there is no writer running."""
+    if queue is None:
+        return False
+    queue.put(('text', text))
+    return True
+
+
+def event(kind, **data):
+    """Send structured event to metrics file."""
+    if queue is None:
+        return
+    record = {'event': kind, 'ts': round(time.time(), 3)}
+    record.update(data)
+    queue.put(('event', json.dumps(record, default=str, separators=(',', ':')) + '\n'))
+
+
+class LogWriter:
+    """
+    Single writer of text log and json-lines metrics, fed through multiprocessing queue
+    by parent and pool workers. Files are buffered and flushed whenever queue goes idle.
+    """
+
+    def __init__(self, log: Path, metrics: Path, idle=0.5):
+        self.log = Path(log)
+        self.metrics = Path(metrics)
+        self.idle = idle
+        self.queue = multiprocessing.Queue()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+
+    def start(self):
+        global queue, writer
+        queue, writer = self.queue, self
+        self.thread.start()
+        # Buffered records are written out on sys.exit too
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        global queue, writer
+        if writer is self:
+            queue, writer = None, None
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def loop(self):
+        with self.log.open('a', buffering=1 << 16) as log, self.metrics.open('a', buffering=1 << 16) as metrics:
+            while True:
+                try:
+                    item = self.queue.get(timeout=self.idle)
+                except Empty:
+                    log.flush()
+                    metrics.flush()
+                    continue
+                if item is None:
+                    break
+                kind, data = item
+                (log if kind == 'text' else metrics).write(data)
@@ -13,22 +13,15 @@ from warnings import warn
 
 
 def sceneDetect(inFile, scenesFile):
-    from scenedetect.video_manager import VideoManager
-    from scenedetect.stats_manager import StatsManager
-    from scenedetect.scene_manager import SceneManager
-    from scenedetect.detectors import ContentDetector
+    from probe import count_frames, keyframe_index
+    from scenes import ScoreCache, frame_scores, cuts_from_scores
+    from util import state_dir
 
-    videoManager = VideoManager([str(inFile)])
-    statsManager = StatsManager()
-    sceneManager = SceneManager(statsManager)
-    sceneManager.add_detector(ContentDetector())
-    baseTimecode = videoManager.get_base_timecode()
+    # Content scores are kept between runs, ContentDetector defaults on full resolution
+    cache = ScoreCache(state_dir() / 'scenes', inFile, {'detector': 'content', 'downscale': 1})
+    scores = frame_scores(inFile, count_frames(inFile), keyframe_index(inFile), os.cpu_count(), cache=cache)
 
-    videoManager.start()
-    sceneManager.detect_scenes(frame_source=videoManager)
-    sceneList = sceneManager.get_scene_list(baseTimecode)
-
-    splitList = [str(scene[0].get_frames()) for scene in sceneList][1:]
+    splitList = [str(x) for x in cuts_from_scores(scores, 30.0)]
 
     return splitList
 
@@ -111,11 +104,9 @@ def main():
                 splits = []
     else:
         if args.splits is not None:
-            from scenedetect.video_manager import VideoManager
+            from probe import count_frames
 
-            videoManager = VideoManager([str(args.input)])
-            total = videoManager.get_duration()[0]
-            total = total.get_frames()
+            total = count_frames(args.input)
 
             splits = [str(i*total//args.splits) for i in range(1, args.splits)]
         else:
@@ -170,7 +161,9 @@ def main():
 
         progScript = Path(__file__).resolve().parent
         progScript /= "progress.py"
-        print(f'progressscript = {progScript}\n', file=fo)
+        print(f'progressscript = {progScript}', file=fo)
+        print(f'containerscript = {progScript.with_name("container.py")}\n',
+              file=fo)
 
         inframes = os.path.join("$(tempdir)",
                                 Path(args.input.name).with_suffix(".fc"))
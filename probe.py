@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import re
+import struct
+import subprocess
+from array import array
+from subprocess import PIPE
+from pathlib import Path
+
+from container import frame_count
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Magic, size and mtime of indexed file
+KEYFRAME_INDEX = struct.Struct('<4sQq')
+
+
+def ffprobe_stream(source: Path, entries, count=False):
+    """Return ffprobe entries of the first video stream as a dict."""
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0']
+    if count:
+        cmd.append('-count_packets')
+    cmd += ['-show_entries', f'stream={",".join(entries)}', '-of', 'json', Path(source).absolute().as_posix()]
+    r = subprocess.run(cmd, stdout=PIPE, stderr=PIPE)
+    try:
+        return json.loads(r.stdout.decode())['streams'][0]
+    except (ValueError, KeyError, IndexError):
+        return {}
+
+
+def decode_frames(source: Path):
+    """Get frame count by decoding whole file, slow but always right."""
+    cmd = ["ffmpeg", "-hide_banner", "-i", Path(source).absolute(), "-map", "0:v:0", "-f", "null", "-"]
+    r = subprocess.run(cmd, stdout=PIPE, stderr=PIPE)
+    matches = re.findall(r"frame=\s*([0-9]+)\s", r.stderr.decode("utf-8") + r.stdout.decode("utf-8"))
+    return int(matches[-1])
+
+
+def count_frames(source: Path):
+    """Get frame count from IVF/Matroska frame headers, container metadata, packet count, or decoding as last resort."""
+    frames = frame_count(source)
+    if frames:
+        return frames
+
+    info = ffprobe_stream(source, ('nb_frames',))
+    frames = info.get('nb_frames', '')
+    if frames.isdigit() and int(frames) > 0:
+        return int(frames)
+
+    info = ffprobe_stream(source, ('nb_read_packets',), count=True)
+    frames = info.get('nb_read_packets', '')
+    if frames.isdigit() and int(frames) > 0:
+        return int(frames)
+
+    return decode_frames(source)
+
+
+def frame_rate(value):
+    """Frame rate of ffprobe num/den string, 0 if it isn't known."""
+    num, _, den = value.partition('/')
+    try:
+        return int(num) / int(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def stream_info(source: Path):
+    """
+    Get resolution, frame rate, codec and start time of first video stream.
+    Stream is variable frame rate when its average frame rate differs from base rate, or isn't known.
+    """
+    info = ffprobe_stream(source, ('codec_name', 'width', 'height', 'pix_fmt', 'r_frame_rate', 'avg_frame_rate',
+                                   'start_time'))
+    fps = frame_rate(info.get('r_frame_rate', '0/1'))
+    avg = frame_rate(info.get('avg_frame_rate', '0/1'))
+    try:
+        start = float(info.get('start_time', 0))
+    except ValueError:
+        start = 0.0
+
+    return {'codec': info.get('codec_name'), 'width': info.get('width', 0), 'height': info.get('height', 0),
+            'pix_fmt': info.get('pix_fmt'), 'fps': fps, 'start': start,
+            'vfr': not fps or abs(avg - fps) > fps * 1e-4}
+
+
+def packet_keyframes(source: Path):
+    """Get keyframe numbers from packet flags, packets are ordered by pts so numbers match decoded frames."""
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts,flags',
+           '-of', 'csv=p=0', Path(source).absolute().as_posix()]
+    r = subprocess.run(cmd, stdout=PIPE, stderr=PIPE)
+    packets = []
+    for i, line in enumerate(r.stdout.decode().split()):
+        pts, _, flags = line.partition(',')
+        packets.append((int(pts) if pts.lstrip('-').isdigit() else i, 'K' in flags))
+    packets.sort(key=lambda x: x[0])
+    return [n for n, (_, key) in enumerate(packets) if key]
+
+
+def keyframe_index_path(source: Path):
+    return Path(source).with_name(f'{Path(source).name}.keyframes')
+
+
+def load_keyframe_index(source: Path):
+    """Sorted keyframe numbers from index file next to source, None if there is no valid index."""
+    st = Path(source).stat()
+    try:
+        with keyframe_index_path(source).open('rb') as f:
+            magic, size, mtime = KEYFRAME_INDEX.unpack(f.read(KEYFRAME_INDEX.size))
+            if magic != b'AVKF' or size != st.st_size or mtime != st.st_mtime_ns:
+                return None
+            keyframes = array('I')
+            keyframes.frombytes(f.read())
+            return keyframes
+    except (OSError, struct.error, ValueError):
+        return None
+
+
+def keyframe_index(source: Path):
+    """
+    Sorted keyframe numbers of source as compact array.
+    Index is built from packet flags without decoding and stored next to source as uint32 array,
+    validated by source size and mtime. Read-only source folder just skips storing.
+    """
+    keyframes = load_keyframe_index(source)
+    if keyframes is not None:
+        return keyframes
+
+    keyframes = array('I', packet_keyframes(source))
+    st = Path(source).stat()
+    file = keyframe_index_path(source)
+    tmp = file.with_name(f'{file.name}.{os.getpid()}.tmp')
+    try:
+        with tmp.open('wb') as f:
+            f.write(KEYFRAME_INDEX.pack(b'AVKF', st.st_size, st.st_mtime_ns))
+            f.write(keyframes.tobytes())
+        os.replace(tmp, file)
+    except OSError:
+        if tmp.exists():
+            tmp.unlink()
+    return keyframes
+
+
+class ProbeCache:
+    """
+    Probe results stored in the temp folder, one json file per media file.
+    Files are keyed by path, size and mtime, so changed files are probed again.
+    """
+
+    def __init__(self, folder: Path):
+        self.folder = Path(folder)
+
+    @staticmethod
+    def key(source: Path):
+        st = source.stat()
+        raw = f'{source.resolve().as_posix()}:{st.st_size}:{st.st_mtime_ns}'
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def path(self, source: Path):
+        return self.folder / f'{self.key(Path(source))}.json'
+
+    def load(self, source: Path):
+        try:
+            with self.path(source).open() as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, source: Path, name, func):
+        """Return cached value of source, computing and storing it with func on miss."""
+        data = self.load(source)
+        if name in data:
+            return data[name]
+
+        value = func(source)
+
+        file = self.path(source)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        lock = os.open(file.with_suffix('.lock'), os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # Reload under lock, other workers could have stored something meanwhile
+            data = self.load(source)
+            data[name] = value
+            tmp = file.with_suffix(f'.{os.getpid()}.tmp')
+            with tmp.open('w') as f:
+                json.dump(data, f)
+            os.replace(tmp, file)
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            os.close(lock)
+
+        return value
+
+    def frames(self, source: Path):
+        return self.get(source, 'frames', count_frames)
+
+    def stream(self, source: Path):
+        return self.get(source, 'stream', stream_info)
+
+    def keyframes(self, source: Path):
+        return keyframe_index(source)
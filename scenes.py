@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import struct
+import subprocess
+from multiprocessing import Pool
+from bisect import bisect_right
+from functools import lru_cache, partial
+from math import ceil
+from pathlib import Path
+
+# Frames in one scored range, ranges are also checkpoints of interrupted detection
+SCORE_RANGE = 2000
+# Sampled blocks of content hash
+HASH_BLOCK = 2 ** 20
+# Magic and total frames of score file
+SCORE_HEADER = struct.Struct('<4sQ')
+# Start frame and number of scores of one range
+SCORE_RECORD = struct.Struct('<II')
+# Pixels of frames read and converted at once by numpy backend
+BLOCK_PIXELS = 2 ** 23
+# Frames narrower than this aren't downscaled, same as PySceneDetect
+MIN_WIDTH = 256
+
+
+def content_val(last, hsv):
+    """ContentDetector metric: mean absolute difference of H, S and V channels of two frames."""
+    import numpy as np
+    diff = np.abs(hsv.astype(np.int32) - last.astype(np.int32))
+    return float(diff.reshape(-1, 3).mean(axis=0).sum() / 3.0)
+
+
+def opencv_scores(job, block=256):
+    """
+    Content scores of frames [start, end) decoded with OpenCV, yielded in blocks, first frame of video scores 0.
+    Decoding begins at keyframe `seek` before start, so first frame of range has previous frame to compare with.
+    """
+    video, start, end, seek, downscale = job
+    import cv2
+    import numpy as np
+
+    cap = cv2.VideoCapture(video)
+    if seek:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, seek)
+
+    scores = []
+    last = None
+    for frame_num in range(seek, end):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if downscale > 1:
+            frame = frame[::downscale, ::downscale, :]
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        if frame_num >= start:
+            scores.append(content_val(last, hsv) if last is not None else 0.0)
+            if len(scores) == block:
+                yield np.array(scores, dtype=np.float32)
+                scores = []
+        last = hsv
+    cap.release()
+
+    if scores:
+        yield np.array(scores, dtype=np.float32)
+
+
+def score_range(scorer, job):
+    """Start frame and content scores of range job, collected from blocks of `scorer`."""
+    import numpy as np
+    blocks = list(scorer(job))
+    return job[1], np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+
+
+def downscale_factor(width):
+    """Downscale factor of PySceneDetect video manager, keeps frames at least MIN_WIDTH wide."""
+    return 1 if width < MIN_WIDTH else width // MIN_WIDTH
+
+
+@lru_cache(maxsize=None)
+def hsv_tables():
+    """
+    Lookup tables of OpenCV 8-bit HSV conversion, which uses 12 bit fixed point division tables.
+    Saturation is indexed by v * 256 + diff, hue by diff * 1536 + num + 255.
+    """
+    import numpy as np
+    x = np.arange(256, dtype=np.int64)
+    sdiv, hdiv = np.zeros(256, np.int64), np.zeros(256, np.int64)
+    sdiv[1:] = np.round((255 << 12) / x[1:])
+    hdiv[1:] = np.round((180 << 12) / (6 * x[1:]))
+    s = (x[None, :] * sdiv[:, None] + (1 << 11)) >> 12
+    h = (np.arange(-255, 1281)[None, :] * hdiv[:, None] + (1 << 11)) >> 12
+    h[h < 0] += 180
+    return s.astype(np.uint8).ravel(), h.astype(np.uint8).ravel()
+
+
+def bgr_to_hsv(frames):
+    """Vectorised OpenCV 8-bit BGR to HSV conversion of (frames, height, width, 3) array, hue is 0-179."""
+    import numpy as np
+    sat, hue = hsv_tables()
+    b, g, r = (frames[..., i] for i in range(3))
+    v = np.maximum(np.maximum(b, g), r)
+    diff = v - np.minimum(np.minimum(b, g), r)
+    s = sat[v.astype(np.intp) * 256 + diff]
+    b, g, r, d = (x.astype(np.int16) for x in (b, g, r, diff))
+    # Hue sector numerator, scaled by 30 / diff in table
+    num = np.where(v == r, g - b, np.where(v == g, b - r + 2 * d, r - g + 4 * d))
+    h = hue[d.astype(np.intp) * 1536 + num + 255]
+    return np.stack((h, s, v), axis=-1)
+
+
+def hsv_scores(last, hsv):
+    """Content scores of block of HSV frames, `last` is frame before block or None for first frame of video."""
+    import numpy as np
+    prev = np.concatenate((hsv[:1] if last is None else last[None], hsv[:-1]))
+    diff = np.abs(hsv.astype(np.int16) - prev.astype(np.int16))
+    return diff.reshape(len(hsv), -1).mean(axis=1).astype(np.float32)
+
+
+def ffmpeg_scores(stream, job):
+    """
+    Content scores of frames [start, end) with numpy backend, yielded in blocks.
+    ffmpeg downscales decoded frames with nearest neighbour to size of OpenCV backend frames before BGR conversion,
+    so only downscaled frames are converted and go through rawvideo pipe. They are scored in blocks of frames instead of frame by frame.
+    """
+    video, start, end, seek, downscale = job
+    import numpy as np
+
+    # Same size as every `downscale` pixel of OpenCV backend
+    width, height = ceil(stream['width'] / downscale), ceil(stream['height'] / downscale)
+    size = width * height * 3
+    scale = ['-vf', f'scale={width}:{height}:flags=neighbor'] if downscale > 1 else []
+    # Seeking needs frame rate to get timestamp of keyframe
+    first = seek if stream.get('fps') else 0
+    cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error']
+    if first:
+        cmd += ['-ss', f'{(first - 0.5) / stream["fps"]:.6f}']
+    cmd += ['-i', Path(video).as_posix(), '-map', '0:v:0', '-an', '-sn', '-frames:v', str(end - first), *scale,
+            '-pix_fmt', 'bgr24', '-f', 'rawvideo', '-']
+
+    block = max(1, BLOCK_PIXELS // (width * height))
+    last = None
+    pos = first
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
+        while pos < end:
+            data = proc.stdout.read(min(block, end - pos) * size)
+            count = len(data) // size
+            if not count:
+                break
+            frames = np.frombuffer(data, dtype=np.uint8, count=count * size).reshape(count, height, width, 3)
+            hsv = bgr_to_hsv(frames)
+            values = hsv_scores(last, hsv)
+            last = hsv[-1]
+            pos += count
+            if pos > start:
+                yield values[max(0, start - pos + count):]
+        proc.stdout.close()
+
+
+def make_ranges(total, keyframes, parts):
+    """Split [0, total) into at most `parts` ranges that start at keyframes."""
+    starts = [0]
+    for i in range(1, parts):
+        target = total * i // parts
+        # Closest keyframe to even split
+        k = bisect_right(keyframes, target)
+        near = [x for x in keyframes[max(0, k - 1): k + 1] if starts[-1] < x < total]
+        if near:
+            starts.append(min(near, key=lambda x: abs(x - target)))
+
+    starts = sorted(set(starts))
+    ends = starts[1:] + [total]
+    ranges = []
+    for start, end in zip(starts, ends):
+        # Decoding from previous keyframe gives frame before range start
+        k = bisect_right(keyframes, start - 1) - 1
+        seek = keyframes[k] if start > 0 and k >= 0 else 0
+        ranges.append((start, end, seek))
+    return ranges
+
+
+def cuts_from_scores(scores, threshold, min_scene_len=15):
+    """
+    Cut frames from content scores the same way ContentDetector does in serial run:
+    frame is cut if its score is over threshold and it's at least `min_scene_len` after last cut.
+    """
+    import numpy as np
+    candidates = np.flatnonzero(np.asarray(scores) >= threshold)
+    cuts = []
+    last = 0
+    for cut in candidates.tolist():
+        if cut > 0 and cut - last >= min_scene_len:
+            cuts.append(cut)
+            last = cut
+    return cuts
+
+
+def content_key(source: Path, settings):
+    """Hash of source size, its first, middle and last block, and detector settings."""
+    source = Path(source)
+    size = source.stat().st_size
+    h = hashlib.sha1(f'{size}:{json.dumps(settings, sort_keys=True)}'.encode())
+    with source.open('rb') as f:
+        for offset in sorted({0, max(0, size // 2 - HASH_BLOCK // 2), max(0, size - HASH_BLOCK)}):
+            f.seek(offset)
+            h.update(f.read(HASH_BLOCK))
+    return h.hexdigest()
+
+
+class ScoreCache:
+    """
+    Per frame content scores of one source, stored in `folder` between runs.
+    File is keyed by sampled content hash and detector settings, so renamed or copied source is found,
+    while changed source or downscale is scored again. Scores of every finished range are appended
+    to file right away, so interrupted detection only scores missing ranges on next run.
+    """
+
+    def __init__(self, folder: Path, source: Path, settings):
+        self.folder = Path(folder)
+        self.path = self.folder / f'{content_key(source, settings)}.scores'
+        # End of last complete record, 0 if there is no valid file
+        self.end = 0
+
+    def load(self, total):
+        """Scores of finished ranges by start frame."""
+        import numpy as np
+        ranges = {}
+        self.end = 0
+        try:
+            with self.path.open('rb') as f:
+                magic, frames = SCORE_HEADER.unpack(f.read(SCORE_HEADER.size))
+                if magic != b'AVSC' or frames != total:
+                    return {}
+                self.end = f.tell()
+                while True:
+                    record = f.read(SCORE_RECORD.size)
+                    if len(record) < SCORE_RECORD.size:
+                        break
+                    start, count = SCORE_RECORD.unpack(record)
+                    data = f.read(count * 4)
+                    # Interrupted write
+                    if len(data) < count * 4:
+                        break
+                    ranges[start] = np.frombuffer(data, dtype='<f4')
+                    self.end = f.tell()
+        except (OSError, struct.error):
+            pass
+        return ranges
+
+    def scores(self, total):
+        """Scores of all frames, None if some frames aren't scored yet."""
+        import numpy as np
+        scores = np.full(total, np.nan, dtype=np.float32)
+        for start, values in self.load(total).items():
+            values = values[:max(0, total - start)]
+            scores[start:start + len(values)] = values
+        return None if np.isnan(scores).any() else scores
+
+    def checkpoint(self, total, start, scores):
+        """Append scores of finished range, after last complete record."""
+        self.folder.mkdir(parents=True, exist_ok=True)
+        with self.path.open('r+b' if self.end else 'wb') as f:
+            if self.end:
+                f.seek(self.end)
+                f.truncate()
+            else:
+                f.write(SCORE_HEADER.pack(b'AVSC', total))
+            f.write(SCORE_RECORD.pack(start, len(scores)))
+            f.write(scores.astype('<f4').tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+            self.end = f.tell()
+
+
+def frame_scores(video, total, keyframes, workers, downscale=1, cache: ScoreCache = None, progress=False,
+                 scorer=opencv_scores):
+    """
+    Content score of every frame of video, ranges are scored with `scorer` in parallel on `workers` processes.
+    With one worker or without keyframe index video is decoded sequentially from first missing range,
+    and every range is stored as soon as its last frame is scored.
+    Ranges already in cache are not decoded again.
+    """
+    import numpy as np
+
+    # Range boundaries don't depend on workers, so checkpoints stay usable with different worker count
+    ranges = make_ranges(total, keyframes, max(16, ceil(total / SCORE_RANGE)))
+    done = {}
+    if cache:
+        done = cache.load(total)
+    missing = [(start, end, seek) for start, end, seek in ranges if start not in done]
+    short = []
+
+    bar = None
+    if progress and missing:
+        from tqdm import tqdm
+        bar = tqdm(total=sum(end - start for start, end, _ in missing), unit='frame', leave=False)
+
+    def collect(start, end, scores):
+        # Range decoded short is kept for this run, but isn't checkpointed as complete
+        if len(scores) < end - start:
+            short.append((start, end))
+        elif cache:
+            cache.checkpoint(total, start, scores)
+        done[start] = scores
+
+    if missing and workers > 1 and keyframes:
+        jobs = [(str(video), start, end, seek, downscale) for start, end, seek in missing]
+        ends = {start: end for start, end, _ in missing}
+        with Pool(min(workers, len(jobs))) as pool:
+            for start, scores in pool.imap_unordered(partial(score_range, scorer), jobs):
+                collect(start, ends[start], scores)
+                if bar:
+                    bar.update(len(scores))
+
+        # Seeking can miss frames, decode short ranges again from first frame
+        retry, short = short, []
+        for start, end in retry:
+            collect(start, end, score_range(scorer, (str(video), start, end, 0, downscale))[1])
+
+    elif missing:
+        # Single seek to first missing range, from there frames are decoded in order
+        first, _, seek = missing[0]
+        todo = [(start, end) for start, end, _ in ranges if start >= first]
+        # Scores of frames from start of first range in todo
+        pending = [np.zeros(0, dtype=np.float32)]
+        for block in scorer((str(video), first, total, seek, downscale)):
+            pending.append(block)
+            if bar:
+                bar.update(len(block))
+            while todo and todo[0][1] - todo[0][0] <= sum(len(x) for x in pending):
+                start, end = todo.pop(0)
+                values = np.concatenate(pending)
+                if start not in done:
+                    collect(start, end, values[:end - start])
+                pending = [values[end - start:]]
+
+        # Decoding ended early, rest of ranges is short
+        values = np.concatenate(pending)
+        for start, end in todo:
+            if start not in done:
+                collect(start, end, values[:end - start])
+            values = values[end - start:]
+
+    if bar:
+        bar.close()
+
+    scores = np.zeros(total, dtype=np.float32)
+    for start, values in done.items():
+        values = values[:max(0, total - start)]
+        scores[start:start + len(values)] = values
+    return scores
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+class ThroughputModel:
+    """
+    Encode time model of one encoder and its params.
+    Time per pixel is fitted as a + b * bpp by least squares over encoded chunks,
+    where bpp (bits per pixel of split source) is complexity of chunk.
+    Fit sums are kept in json file, so model carries over between runs.
+    """
+
+    def __init__(self, path: Path, encoder, params, passes):
+        self.path = Path(path)
+        self.key = f'{encoder}:' + hashlib.sha1(f'{passes} {" ".join(params.split())}'.encode()).hexdigest()[:12]
+        self.sums = self.load().get(self.key, {'n': 0, 'x': 0.0, 'y': 0.0, 'xx': 0.0, 'xy': 0.0})
+
+    def load(self):
+        try:
+            with self.path.open() as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        data = self.load()
+        data[self.key] = self.sums
+        tmp = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        with tmp.open('w') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def coefficients(self):
+        s = self.sums
+        if s['n'] == 0:
+            # Any constant keeps order by frames * pixels until first chunk is done
+            return 1e-7, 0.0
+        mean_x, mean_y = s['x'] / s['n'], s['y'] / s['n']
+        var = s['xx'] / s['n'] - mean_x ** 2
+        if s['n'] < 3 or var <= 1e-12:
+            return mean_y, 0.0
+        b = max(0.0, (s['xy'] / s['n'] - mean_x * mean_y) / var)
+        return mean_y - b * mean_x, b
+
+    def predict(self, frames, pixels, bpp):
+        """Predicted encode time in seconds."""
+        a, b = self.coefficients()
+        return frames * pixels * max(a + b * bpp, 1e-12)
+
+    def add(self, frames, pixels, bpp, seconds):
+        if frames <= 0 or pixels <= 0 or seconds <= 0:
+            return
+        y = seconds / (frames * pixels)
+        s = self.sums
+        s['n'] += 1
+        s['x'] += bpp
+        s['y'] += y
+        s['xx'] += bpp * bpp
+        s['xy'] += bpp * y
+
+
+class ChunkScheduler:
+    """
+    Longest-processing-time-first queue of chunks.
+    Cost of every chunk is estimated from frame count, resolution and source bitrate
+    by throughput model, which is refined as chunks get done.
+    """
+
+    def __init__(self, model: ThroughputModel):
+        self.model = model
+        self.pending = {}
+        self.features = {}
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, name, item, frames, pixels, size):
+        bpp = size * 8 / max(1, frames * pixels)
+        self.pending[name] = item
+        self.features[name] = (frames, pixels, bpp)
+
+    def cost(self, name):
+        return self.model.predict(*self.features[name])
+
+    def pop(self):
+        """Most expensive pending chunk."""
+        name = max(self.pending, key=self.cost)
+        return name, self.pending.pop(name)
+
+    def done(self, name, seconds):
+        """Learn from finished chunk."""
+        if name in self.features:
+            self.model.add(*self.features[name], seconds)
+            self.model.save()
+
+    def requeue(self, name, item):
+        """Return chunk taken by pop back to queue."""
+        self.pending[name] = item
@@ -0,0 +1,115 @@
+from balancer import balance, makespan, merge_short, split_long
+
+
+def lengths(cuts, total):
+    bounds = [0, *cuts, total]
+    return [b - a for a, b in zip(bounds, bounds[1:])]
+
+
+def test_empty_scenes_without_split_keep_one_chunk():
+    assert balance([], list(range(0, 1000, 10)), 1000, 4) == []
+
+
+def test_empty_scenes_are_split_at_keyframes():
+    cuts = balance([], list(range(0, 1000, 10)), 1000, 4, max_len=100)
+    assert set(cuts) <= set(range(0, 1000, 10))
+    assert max(lengths(cuts, 1000)) <= 100
+
+
+def test_zero_total():
+    assert balance([10, 20], [0, 10], 0, 4, 5, 10) == []
+
+
+def test_min_len_over_total_merges_everything():
+    assert balance([100, 200, 300], [0, 100, 200, 300], 400, 4, min_len=1000) == []
+
+
+def test_no_keyframes_leaves_long_scene():
+    assert balance([500], [], 1000, 4, max_len=100) == [500]
+
+
+def test_one_huge_scene_is_split_evenly():
+    total = 10000
+    cuts = balance([], list(range(0, total, 50)), total, 8, max_len=500)
+    sizes = lengths(cuts, total)
+    assert max(sizes) <= 500
+    assert len(sizes) == 20
+
+
+def test_workers_over_scenes():
+    cuts = balance([300, 600], list(range(0, 900, 25)), 900, 64, max_len=100)
+    assert {300, 600} <= set(cuts)
+    assert max(lengths(cuts, 900)) <= 100
+
+
+def test_min_split_only_merges():
+    scenes = [5, 10, 15, 1000]
+    cuts = balance(scenes, list(range(0, 2000, 5)), 2000, 2, min_len=20)
+    assert min(lengths(cuts, 2000)) >= 20
+    # Long scene isn't split without max length
+    assert 1000 in cuts and cuts[-1] == 1000
+
+
+def test_merge_stays_within_worker_share():
+    # Short scenes aren't merged into chunk longer than half of worker share
+    scenes = list(range(10, 1000, 10))
+    cuts = balance(scenes, scenes, 1000, 4, min_len=50)
+    assert max(lengths(cuts, 1000)) <= 125
+
+
+def test_user_max_len_is_kept_over_share():
+    # Max length over half of worker share is used as given
+    cuts = balance([], list(range(0, 1000, 10)), 1000, 8, max_len=400)
+    assert max(lengths(cuts, 1000)) > 1000 // 8 // 2
+
+
+def test_unsorted_keyframes():
+    cuts = balance([], [500, 0, 250, 750], 1000, 4, max_len=250)
+    assert cuts == [250, 500, 750]
+
+
+def test_split_long_respects_min_len():
+    assert split_long(0, 100, [1, 2, 98, 99], 50, 10) == []
+
+
+def test_merge_short_merges_into_shorter_neighbour():
+    assert merge_short([0, 100, 105, 130], 10, 1000) == [0, 100, 130]
+
+
+def test_makespan():
+    assert makespan([5, 4, 3, 3, 3], 2) == 10
+    assert makespan([], 4) == 0
+
+
+class FakeProbe:
+    def __init__(self, folder):
+        pass
+
+    def frames(self, source):
+        return 10000
+
+    def keyframes(self, source):
+        return list(range(0, 10000, 50))
+
+
+def test_extra_split_keeps_worker_pool_limit(tmp_path, monkeypatch):
+    import av1an
+    from collections import namedtuple
+
+    monkeypatch.setattr(av1an, 'ProbeCache', FakeProbe)
+    monkeypatch.setattr(av1an.os, 'cpu_count', lambda: 16)
+    monkeypatch.setattr(av1an, 'virtual_memory', lambda: namedtuple('Memory', 'total')(64 * 2 ** 30))
+
+    job = av1an.Av1an()
+    job.d = {'temp': tmp_path, 'logging': tmp_path / 'log.log', 'input': tmp_path / 'input.mkv',
+             'encoder': 'aom', 'workers': 0, 'extra_split': 500, 'min_split': 24}
+    job.determine_resources()
+    assert (job.d['workers'], job.d['max_workers']) == (8, 16)
+
+    cuts = job.extra_split('1000,5000')
+    assert (job.d['workers'], job.d['max_workers']) == (8, 16)
+    assert {1000, 5000} <= {int(x) for x in cuts.split(',')}
+
+    # Second determination, before encoding, keeps limit too
+    job.determine_resources()
+    assert (job.d['workers'], job.d['max_workers']) == (8, 16)
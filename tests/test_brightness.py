@@ -0,0 +1,40 @@
+import io
+
+import numpy as np
+
+import brightness
+from brightness import geometric_mean, luma_means
+
+
+class FakeFFmpeg:
+    """Pipe of gray planes in place of ffmpeg."""
+
+    def __init__(self, data):
+        self.stdout = io.BytesIO(data)
+
+    def wait(self):
+        return 0
+
+
+def opencv_gray(y):
+    """Gray of OpenCV decoded frame with neutral chroma: BT.601 limited range Y to full range RGB."""
+    return np.clip(np.round(1.164383 * (y.astype(np.float64) - 16)), 0, 255)
+
+
+def test_luma_means_match_opencv_gray(monkeypatch):
+    # Known frames: black, white, mid gray and ramp over whole 8-bit range with out of range values
+    frames = [np.full(256 * 144, 16), np.full(256 * 144, 235), np.full(256 * 144, 126),
+              np.arange(256 * 144) % 256]
+    data = b''.join(x.astype(np.uint8).tobytes() for x in frames)
+    monkeypatch.setattr(brightness.subprocess, 'Popen', lambda *args, **kwargs: FakeFFmpeg(data))
+
+    means = luma_means('video.mkv', 256, 144)
+    expected = [opencv_gray(x).mean() for x in frames]
+    assert np.allclose(means, expected, atol=0.5)
+    assert means[0] == 0 and means[1] == 255
+
+
+def test_geometric_mean():
+    assert geometric_mean(np.zeros(0)) == 0.0
+    assert geometric_mean(np.array([0.0, 0.0])) == 1.0
+    assert geometric_mean(np.array([127.0, 127.0])) == 128.0
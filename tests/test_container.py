@@ -0,0 +1,44 @@
+import struct
+
+from container import IVF_FRAME, IVF_HEADER, ChunkMuxer, frame_count
+from journal import Journal
+
+
+def write_ivf(path, frames):
+    with path.open('wb') as f:
+        f.write(IVF_HEADER.pack(b'DKIF', 0, IVF_HEADER.size, b'AV01', 64, 64, 24, 1, frames))
+        for pts in range(frames):
+            f.write(IVF_FRAME.pack(4, pts))
+            f.write(struct.pack('<I', pts))
+
+
+def test_muxer_appends_chunks_in_order(tmp_path):
+    encode = tmp_path / 'encode'
+    encode.mkdir()
+    journal = Journal(tmp_path / 'done.jsonl')
+    journal.start(30, ['00000.mkv', '00001.mkv'])
+    write_ivf(encode / '00000.ivf', 10)
+    write_ivf(encode / '00001.ivf', 20)
+
+    muxer = ChunkMuxer(tmp_path / 'video.ivf', journal, encode)
+    muxer.done('00001.mkv')
+    assert not (tmp_path / 'video.ivf').exists()
+    muxer.done('00000.mkv')
+    assert frame_count(tmp_path / 'video.ivf') == 30
+
+
+def test_no_check_missing_chunk_is_failed(tmp_path):
+    from av1an import Av1an
+
+    job = Av1an()
+    job.d = {'temp': tmp_path, 'no_check': True}
+    job.chunk_frames = lambda source: 10
+    source, encoded = tmp_path / 'split' / '00000.mkv', tmp_path / 'encode' / '00000.ivf'
+
+    assert job.frame_check(source, encoded) is False
+    assert job.journal().done() == {}
+
+    encoded.parent.mkdir()
+    write_ivf(encoded, 10)
+    assert job.frame_check(source, encoded) is True
+    assert job.journal().done() == {'00000.mkv': 10}
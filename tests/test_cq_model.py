@@ -0,0 +1,137 @@
+import json
+import random
+from multiprocessing import Process
+
+import pytest
+
+import cq_model
+from cq_model import CQModel
+from vmaf_search import CQSearch
+
+
+def vmaf_of(features, cq):
+    """Synthetic linear vmaf of chunk, falls 0.8 per CQ step."""
+    return 100 - 0.8 * cq - 5 * features['brightness'] / 255 - 10 * features['motion'] / 255
+
+
+def chunk(rng):
+    return {'frames': rng.randint(50, 500), 'bpp': rng.uniform(0.05, 0.5),
+            'brightness': rng.uniform(20, 200), 'motion': rng.uniform(0, 60)}
+
+
+def trained(path, chunks, seed=1):
+    model = CQModel(path, {'encoder': 'aom'})
+    rng = random.Random(seed)
+    for _ in range(chunks):
+        features = chunk(rng)
+        model.add(features, [(cq, vmaf_of(features, cq)) for cq in (20, 30, 40)])
+    return model
+
+
+def test_empty_model_searches(tmp_path):
+    model = CQModel(tmp_path / 'cq_model.json', {'encoder': 'aom'})
+    assert model.fit() is None
+    assert model.plan(chunk(random.Random(0)), 93, 10, 60) == ('search', None, None)
+
+
+def test_fit_recovers_linear_vmaf(tmp_path):
+    model = trained(tmp_path / 'cq_model.json', 10)
+    w, error = model.fit()
+    assert error < 1e-3
+    assert w[1] == pytest.approx(-0.8, abs=1e-3)
+
+    features = chunk(random.Random(5))
+    cq, slope, _ = model.predict(features, 80, 10, 60)
+    assert slope == pytest.approx(-0.8, abs=1e-3)
+    assert abs(vmaf_of(features, cq) - 80) <= 0.8
+
+
+def test_plan_confirms_until_predictions_are_checked(tmp_path):
+    # Exact fit, but too few probed chunks to skip probes
+    model = trained(tmp_path / 'cq_model.json', 5)
+    mode, cq, slope = model.plan(chunk(random.Random(5)), 80, 10, 60)
+    assert mode == 'confirm' and cq is not None
+
+
+def test_plan_predicts_after_checked_predictions(tmp_path, monkeypatch):
+    model = trained(tmp_path / 'cq_model.json', 30)
+    assert model.sums['checks'] >= cq_model.TRUST_CHECKS
+    monkeypatch.setattr(cq_model.random, 'random', lambda: 1.0)
+    assert model.plan(chunk(random.Random(5)), 80, 10, 60)[0] == 'predicted'
+    # Share of predictions is still probed
+    monkeypatch.setattr(cq_model.random, 'random', lambda: 0.0)
+    assert model.plan(chunk(random.Random(5)), 80, 10, 60)[0] == 'confirm'
+
+
+def test_plan_confirms_when_predictions_miss(tmp_path, monkeypatch):
+    model = trained(tmp_path / 'cq_model.json', 30)
+    model.sums['check_sse'] = model.sums['checks'] * 4.0
+    monkeypatch.setattr(cq_model.random, 'random', lambda: 1.0)
+    assert model.plan(chunk(random.Random(5)), 80, 10, 60)[0] == 'confirm'
+
+
+def test_plan_searches_on_bad_fit(tmp_path):
+    model = CQModel(tmp_path / 'cq_model.json', {'encoder': 'aom'})
+    rng = random.Random(2)
+    for _ in range(10):
+        features = chunk(rng)
+        model.add(features, [(cq, rng.uniform(40, 100)) for cq in (20, 30, 40)])
+    assert model.plan(chunk(rng), 80, 10, 60)[0] == 'search'
+
+
+def test_models_are_kept_per_settings(tmp_path):
+    trained(tmp_path / 'cq_model.json', 10)
+    other = CQModel(tmp_path / 'cq_model.json', {'encoder': 'svt_av1'})
+    assert other.sums['n'] == 0
+
+
+def add_probes(path, seed):
+    trained(path, 20, seed)
+
+
+def test_concurrent_workers_keep_all_probes(tmp_path):
+    path = tmp_path / 'cq_model.json'
+    workers = [Process(target=add_probes, args=(path, seed)) for seed in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join(30)
+    data = json.loads(path.read_text())
+    assert next(iter(data.values()))['n'] == 4 * 20 * 3
+
+
+def linear_probe(cq):
+    return 100 - 0.8 * cq
+
+
+def test_confirm_hit():
+    search = CQSearch(linear_probe, 76, 10, 60)
+    assert search.confirm(30, -0.8, 0.5) == (30, 76)
+    assert list(search.results) == [30]
+
+
+def test_confirm_second_probe_by_slope():
+    search = CQSearch(linear_probe, 76, 10, 60)
+    cq, vmaf = search.confirm(25, -0.8, 0.5)
+    assert cq == 30 and vmaf == pytest.approx(76)
+    assert len(search.results) == 2
+
+
+def test_confirm_wrong_slope_uses_secant():
+    search = CQSearch(linear_probe, 76, 10, 60)
+    cq, vmaf = search.confirm(26, -2.0, 0.5)
+    assert cq == 30 and vmaf == pytest.approx(76)
+
+
+def test_confirm_stays_within_cq_range():
+    search = CQSearch(linear_probe, 30, 10, 60)
+    cq, _ = search.confirm(58, -0.8, 0.5)
+    assert 10 <= cq <= 60
+
+
+def test_confirm_noise_keeps_closest_probe():
+    values = {30: 70.0, 27: 69.0}
+    search = CQSearch(values.get, 76, 10, 60)
+    # Lower CQ gave lower vmaf, so probe closer to target is kept instead of secant
+    assert search.confirm(30, -2.0, 0.5) == (30, 70.0)
+    assert sorted(search.results) == [27, 30]
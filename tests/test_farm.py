@@ -0,0 +1,176 @@
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from conftest import ROOT
+from farm import ChunkFarm, serve, connect
+from journal import Journal
+from scheduler import ThroughputModel, ChunkScheduler
+
+FRAMES = 24
+AUTHKEY = b'test'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def node(address, name, crash_after=None):
+    """Encoder node that reverses chunk bytes as its encode, optionally dying while holding a chunk."""
+    farm = connect(address, AUTHKEY)
+    done = 0
+    while True:
+        task = farm.request(name)
+        if task is None:
+            if farm.finished():
+                return
+            time.sleep(0.05)
+            continue
+        chunk, data = task
+        if crash_after is not None and done == crash_after:
+            os._exit(1)
+        time.sleep(0.05)
+        farm.complete(name, chunk, data[::-1], FRAMES, 0.05)
+        done += 1
+
+
+def make_farm(tmp_path, chunks, timeout=1.0):
+    split, encode = tmp_path / 'split', tmp_path / 'encode'
+    split.mkdir()
+    encode.mkdir()
+    scheduler = ChunkScheduler(ThroughputModel(tmp_path / 'throughput.json', 'aom', '', 1))
+    for n in range(chunks):
+        name = f'{n:05d}.mkv'
+        (split / name).write_bytes(name.encode() * (n + 1))
+        scheduler.add(name, name, FRAMES, 64 * 64, n + 1)
+    journal = Journal(tmp_path / 'done.jsonl')
+    return ChunkFarm(scheduler, {'encoder': 'aom'}, split, encode, journal, log=lambda x: None,
+                     timeout=timeout), encode
+
+
+def run_master(farm, nodes, deadline=30):
+    start = time.time()
+    while not farm.finished():
+        assert time.time() - start < deadline, 'farm did not finish'
+        farm.reap()
+        time.sleep(0.05)
+    for p in nodes:
+        p.join(5)
+
+
+def test_two_nodes_encode_every_chunk(tmp_path):
+    farm, encode = make_farm(tmp_path, 8)
+    address = ('127.0.0.1', free_port())
+    serve(farm, address, AUTHKEY)
+
+    nodes = [multiprocessing.Process(target=node, args=(address, f'node{i}')) for i in range(2)]
+    for p in nodes:
+        p.start()
+    run_master(farm, nodes)
+
+    assert farm.frames == 8 * FRAMES
+    for n in range(8):
+        name = f'{n:05d}.mkv'
+        assert (encode / f'{n:05d}.ivf').read_bytes() == (name.encode() * (n + 1))[::-1]
+    assert {r['node'] for r in farm.journal.records() if r.get('status') == 'done'} <= {'node0', 'node1'}
+
+
+def test_chunk_of_dead_node_is_encoded_by_other(tmp_path):
+    farm, encode = make_farm(tmp_path, 6)
+    address = ('127.0.0.1', free_port())
+    serve(farm, address, AUTHKEY)
+
+    dead = multiprocessing.Process(target=node, args=(address, 'dead', 1))
+    dead.start()
+    dead.join(10)
+    alive = multiprocessing.Process(target=node, args=(address, 'alive'))
+    alive.start()
+    run_master(farm, [alive])
+
+    assert farm.frames == 6 * FRAMES
+    assert len(list(encode.glob('*.ivf'))) == 6
+
+
+def test_wrong_authkey_is_rejected(tmp_path):
+    farm, _ = make_farm(tmp_path, 1)
+    address = ('127.0.0.1', free_port())
+    serve(farm, address, AUTHKEY)
+    from multiprocessing import AuthenticationError
+    with pytest.raises(AuthenticationError):
+        connect(address, b'wrong', retries=1)
+
+
+@pytest.mark.skipif(not shutil.which('ffmpeg'), reason='requires ffmpeg')
+def test_master_and_two_encoder_processes(tmp_path):
+    """av1an master and two av1an encoder nodes on localhost, encoders replaced by fake encoder."""
+    sys.path.insert(0, str(ROOT / 'benchmarks'))
+    from bench_pipeline import make_shims, make_source
+
+    shims = make_shims(tmp_path / 'bin')
+    # Nodes must check encoder of master, not default aom
+    (shims / 'aomenc').unlink()
+    env = dict(os.environ, PATH=f'{shims}{os.pathsep}{os.environ["PATH"]}', AV1AN_STATE=str(tmp_path / 'state'))
+    src = make_source(tmp_path, 320, 240, 8)
+    port = str(free_port())
+    farm = ['--host', '127.0.0.1', '--port', port, '--authkey', 'test']
+    av1an = [sys.executable, str(ROOT / 'av1an.py')]
+
+    master = subprocess.Popen([*av1an, '-i', str(src), '-o', str(tmp_path / 'out.mkv'), '--mode', '1',
+                               '-enc', 'svt_av1', '-v', ' -w 320 -h 240 --fps 24 ', '--passes', '1', *farm],
+                              cwd=tmp_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # Nodes run where source isn't
+    cwd = tmp_path / 'nodes'
+    cwd.mkdir()
+    nodes = [subprocess.Popen([*av1an, '--mode', '2', '--temp', str(tmp_path / f'node{i}'), *farm],
+                              cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+             for i in range(2)]
+    try:
+        assert master.wait(300) == 0
+        assert (tmp_path / 'out.mkv').exists()
+    finally:
+        for p in nodes + [master]:
+            if p.poll() is None:
+                p.kill()
+
+
+def test_node_cq_features_without_source(tmp_path, monkeypatch):
+    """Node computes CQ model features from chunk and stream info of master, source is only on master."""
+    import av1an
+
+    class FakeProbe:
+        def __init__(self, folder):
+            pass
+
+        def stream(self, source):
+            assert source.exists()
+            return {'width': 64, 'height': 48, 'fps': 24.0, 'vfr': False}
+
+    monkeypatch.setattr(av1an, 'ProbeCache', FakeProbe)
+    master = av1an.Av1an()
+    (tmp_path / 'master').mkdir()
+    master.d = {'temp': tmp_path / 'master' / 'temp', 'input': tmp_path / 'master' / 'source.mkv', 'encoder': 'aom'}
+    master.d['input'].write_bytes(b'x')
+    settings = master.farm_settings()
+
+    monkeypatch.chdir(tmp_path)
+    job = av1an.Av1an()
+    job.d = {'temp': tmp_path / 'node'}
+    job.d.update(settings)
+    assert not Path(job.d['input']).exists()
+    source = job.d['temp'] / 'split' / '00000.mkv'
+    source.parent.mkdir(parents=True)
+    source.write_bytes(b'x' * 960)
+    job.frame_probe = lambda video: 10
+    job.get_brightness = lambda video: 100.0
+
+    features = job.cq_features(source)
+    assert features['frames'] == 10 and features['bpp'] == 960 * 8 / (10 * 64 * 48)
@@ -0,0 +1,42 @@
+from multiprocessing import Process
+
+import probe
+from probe import ProbeCache, frame_rate, stream_info
+
+
+def test_frame_rate():
+    assert frame_rate('24000/1001') == 24000 / 1001
+    assert frame_rate('25') == 25
+    assert frame_rate('0/0') == 0
+    assert frame_rate('') == 0
+
+
+def probed(monkeypatch, r_rate, avg_rate):
+    info = {'codec_name': 'h264', 'width': 1920, 'height': 1080, 'r_frame_rate': r_rate,
+            'avg_frame_rate': avg_rate}
+    monkeypatch.setattr(probe, 'ffprobe_stream', lambda source, entries: info)
+    return stream_info('video.mkv')
+
+
+def test_variable_frame_rate(monkeypatch):
+    assert not probed(monkeypatch, '24000/1001', '24000/1001')['vfr']
+    assert probed(monkeypatch, '60/1', '8497/200')['vfr']
+    assert probed(monkeypatch, '30/1', '0/0')['vfr']
+    assert probed(monkeypatch, '0/0', '0/0')['fps'] == 0
+
+
+def store(folder, source, worker):
+    cache = ProbeCache(folder)
+    for n in range(20):
+        cache.get(source, f'{worker}_{n}', lambda x: n)
+
+
+def test_concurrent_workers_keep_all_entries(tmp_path):
+    source = tmp_path / 'video.mkv'
+    source.write_bytes(b'x')
+    workers = [Process(target=store, args=(tmp_path / 'probe', source, i)) for i in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join(30)
+    assert len(ProbeCache(tmp_path / 'probe').load(source)) == 4 * 20
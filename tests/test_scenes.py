@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+from scenes import ScoreCache, bgr_to_hsv, cuts_from_scores, frame_scores, make_ranges
+
+TOTAL = 5000
+KEYFRAMES = list(range(0, TOTAL, 50))
+RANGES = make_ranges(TOTAL, KEYFRAMES, 16)
+
+
+def fake_scores(start, end):
+    return np.arange(start, end, dtype=np.float32) % 97
+
+
+def blocks(start, end, size=100):
+    for x in range(start, end, size):
+        yield fake_scores(x, min(x + size, end))
+
+
+def scorer(job):
+    video, start, end, seek, downscale = job
+    yield from blocks(start, end)
+
+
+def seek_misses_frames(job):
+    """Seeking decoder that stops 10 frames early, full range without seek."""
+    video, start, end, seek, downscale = job
+    yield from blocks(start, end - 10 if seek else end)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    video = tmp_path / 'video'
+    video.write_bytes(b'x' * 100)
+    return ScoreCache(tmp_path / 'cache', video, {})
+
+
+def test_make_ranges_start_at_keyframes():
+    assert RANGES[0][0] == 0 and RANGES[-1][1] == TOTAL
+    for (start, end, seek), nxt in zip(RANGES, RANGES[1:]):
+        assert end == nxt[0]
+        assert start in KEYFRAMES and seek < start or start == 0
+
+
+def test_parallel_and_serial_scores_match():
+    expected = fake_scores(0, TOTAL)
+    assert np.array_equal(frame_scores('video', TOTAL, KEYFRAMES, 4, scorer=scorer), expected)
+    assert np.array_equal(frame_scores('video', TOTAL, KEYFRAMES, 1, scorer=scorer), expected)
+    assert np.array_equal(frame_scores('video', TOTAL, [], 4, scorer=scorer), expected)
+
+
+def test_serial_checkpoints_every_range_while_decoding(cache):
+    stored = []
+
+    def watched(job):
+        for block in scorer(job):
+            stored.append(len(cache.load(TOTAL)))
+            yield block
+
+    frame_scores(cache.path.name, TOTAL, KEYFRAMES, 1, cache=cache, scorer=watched)
+    # Ranges were stored before decoding finished
+    assert stored[-1] == len(RANGES) - 1
+    assert np.array_equal(cache.scores(TOTAL), fake_scores(0, TOTAL))
+
+
+def test_serial_resume_decodes_from_first_missing_range(cache):
+    class Interrupted(Exception):
+        pass
+
+    def interrupted(job):
+        for n, block in enumerate(scorer(job)):
+            if n == 25:
+                raise Interrupted
+            yield block
+
+    with pytest.raises(Interrupted):
+        frame_scores(cache.path.name, TOTAL, KEYFRAMES, 1, cache=cache, scorer=interrupted)
+    finished = sorted(cache.load(TOTAL))
+    assert finished and len(finished) < len(RANGES)
+
+    jobs = []
+
+    def resumed(job):
+        jobs.append(job)
+        yield from scorer(job)
+
+    scores = frame_scores(cache.path.name, TOTAL, KEYFRAMES, 1, cache=cache, scorer=resumed)
+    assert np.array_equal(scores, fake_scores(0, TOTAL))
+    start, end, seek = RANGES[len(finished)]
+    assert [job[1:4] for job in jobs] == [(start, TOTAL, seek)]
+
+
+def test_short_range_is_retried_without_seek(cache):
+    scores = frame_scores(cache.path.name, TOTAL, KEYFRAMES, 4, cache=cache, scorer=seek_misses_frames)
+    assert np.array_equal(scores, fake_scores(0, TOTAL))
+    assert np.array_equal(cache.scores(TOTAL), fake_scores(0, TOTAL))
+
+
+def test_short_range_is_not_checkpointed(cache):
+    def decoded_short(job):
+        video, start, end, seek, downscale = job
+        yield from blocks(start, min(end, TOTAL - 10))
+
+    frame_scores(cache.path.name, TOTAL, KEYFRAMES, 1, cache=cache, scorer=decoded_short)
+    assert cache.scores(TOTAL) is None
+    assert len(cache.load(TOTAL)) == len(RANGES) - 1
+
+
+def test_cuts_from_scores_keep_min_scene_len():
+    scores = np.zeros(100)
+    scores[[5, 10, 30, 40, 60]] = 50
+    assert cuts_from_scores(scores, 30, 15) == [30, 60]
+
+
+def test_bgr_to_hsv_matches_opencv():
+    # Hue of reds just below zero rounds to 179 in OpenCV
+    assert bgr_to_hsv(np.array([[[[28, 25, 205]]]], np.uint8)).tolist() == [[[[179, 224, 205]]]]
+
+    cv2 = pytest.importorskip('cv2')
+    frames = np.random.default_rng(0).integers(0, 256, (4, 64, 256, 3), dtype=np.uint8)
+    expected = np.stack([cv2.cvtColor(frame, cv2.COLOR_BGR2HSV) for frame in frames])
+    assert np.array_equal(bgr_to_hsv(frames), expected)
@@ -0,0 +1,30 @@
+import numpy as np
+
+from journal import Journal
+
+
+def write_log(path, scores):
+    frames = ''.join(f'<frame frameNum="{n}" vmaf="{x}" />' for n, x in enumerate(scores))
+    path.write_text(f'<VMAF><frames>{frames}</frames></VMAF>')
+
+
+def test_chunks_vmaf_keeps_gap_of_missing_chunk(tmp_path, capsys):
+    from av1an import Av1an
+
+    journal = Journal(tmp_path / 'done.jsonl')
+    journal.start(9, ['00000.mkv', '00001.mkv', '00002.mkv'])
+    for name in ('00000.mkv', '00001.mkv', '00002.mkv'):
+        journal.chunk(name, 'done', frames=3)
+    (tmp_path / 'vmaf').mkdir()
+    write_log(tmp_path / 'vmaf' / '00000.xml', [90, 91, 92])
+    write_log(tmp_path / 'vmaf' / '00002.xml', [80, 81, 82])
+
+    job = Av1an()
+    job.d = {'temp': tmp_path}
+    x, vmafs, mean, *_ = job.chunks_vmaf()
+
+    assert 'Vmaf missing for 1 of 3 chunks: 00001.mkv' in capsys.readouterr().out
+    assert len(vmafs) == 9
+    assert np.isnan(vmafs[3:6]).all()
+    assert list(vmafs[6:]) == [80, 81, 82]
+    assert mean == 86.0
@@ -1,5 +1,7 @@
 import subprocess
 import re
+import os
+from pathlib import Path
 
 
 def testMakeVersion():
@@ -14,3 +16,10 @@ def testMakeVersion():
     if v.startswith("GNU Make 4.3"):
         return True
     return False
+
+
+def state_dir():
+    """Folder for data kept between runs, AV1AN_STATE overrides default ~/.av1an"""
+    d = Path(os.environ.get('AV1AN_STATE', Path.home() / '.av1an'))
+    d.mkdir(parents=True, exist_ok=True)
+    return d
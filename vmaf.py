@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import re
+from pathlib import Path
+from xml.etree.ElementTree import iterparse
+import numpy as np
+
+# Per frame score in libvmaf json log, pooled "vmaf" entries are objects and don't match
+JSON_SCORE = re.compile(rb'"vmaf"\s*:\s*(-?[0-9.]+(?:[eE][-+]?[0-9]+)?|NaN|nan)')
+
+
+class Scores:
+    """Growable preallocated array of per frame scores."""
+
+    def __init__(self, expected=0):
+        self.data = np.empty(max(expected, 1024), dtype=np.float32)
+        self.size = 0
+
+    def append(self, value):
+        if self.size == len(self.data):
+            data = np.empty(len(self.data) * 2, dtype=np.float32)
+            data[:self.size] = self.data
+            self.data = data
+        self.data[self.size] = value
+        self.size += 1
+
+    def array(self):
+        return self.data[:self.size]
+
+
+def parse_xml(log: Path, expected=0):
+    """Stream libvmaf xml log, elements are dropped as soon as they are read."""
+    scores = Scores(expected)
+    for _, elem in iterparse(str(log), events=('end',)):
+        if elem.tag == 'frame':
+            value = elem.get('vmaf')
+            if value is not None:
+                scores.append(float(value))
+        elem.clear()
+    return scores.array()
+
+
+def parse_json(log: Path, expected=0, block=1 << 20):
+    """Scan libvmaf json log in blocks for per frame vmaf values."""
+    scores = Scores(expected)
+    tail = b''
+    with open(log, 'rb') as f:
+        while True:
+            data = f.read(block)
+            buf = tail + data
+            safe = len(buf) if not data else len(buf) - 64
+            pos = 0
+            for match in JSON_SCORE.finditer(buf):
+                # Number at block end could be cut, take it with next block
+                if match.end() >= safe:
+                    break
+                scores.append(float(match.group(1)))
+                pos = match.end()
+            if not data:
+                break
+            tail = buf[max(pos, len(buf) - 128):]
+    return scores.array()
+
+
+def parse_log(log: Path, expected=0):
+    """Per frame vmaf scores of libvmaf xml or json log."""
+    with open(log, 'rb') as f:
+        is_json = f.read(64).lstrip().startswith(b'{')
+    if is_json:
+        return parse_json(log, expected)
+    return parse_xml(log, expected)
+
+
+def sidecar(log: Path):
+    return Path(log).with_suffix('.npy')
+
+
+def load_scores(log: Path, expected=0):
+    """Scores of log, parsed once and cached in .npy file next to it."""
+    log, npy = Path(log), sidecar(log)
+    if npy.exists() and npy.stat().st_mtime >= log.stat().st_mtime:
+        return np.load(npy)
+
+    scores = parse_log(log, expected)
+    np.save(npy, scores)
+    return scores
+
+
+def score_stats(scores):
+    """Mean, 1%, 25% and 75% percentiles of scores, NaN frames are skipped."""
+    valid = scores[~np.isnan(scores)]
+    if len(valid) == 0:
+        return 0.0, 0.0, 0.0, 0.0
+    perc_1, perc_25, perc_75 = np.percentile(valid, [1, 25, 75])
+    return round(float(valid.mean()), 2), round(float(perc_1), 2), round(float(perc_25), 2), round(float(perc_75), 2)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+class CQSearch:
+    """
+    Search of CQ value that gives target VMAF.
+    Probe is a callable cq -> vmaf, probes of one round run concurrently in threads.
+    With `score`, probe only encodes and score maps list of encodes of round to their vmaf in one call.
+    VMAF is expected to go down while CQ goes up.
+    """
+
+    def __init__(self, probe, target, min_cq, max_cq, threads=1, error=0.0, score=None):
+        self.probe = probe
+        self.score = score
+        self.target = target
+        self.min_cq = min_cq
+        self.max_cq = max_cq
+        self.threads = max(1, threads)
+        self.error = error
+        self.results = {}
+
+    def run(self, cqs):
+        """Probe all new cq values, at most `threads` at time."""
+        cqs = [int(x) for x in dict.fromkeys(cqs) if int(x) not in self.results]
+        if not cqs:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.threads, len(cqs))) as executor:
+            probed = list(executor.map(self.probe, cqs))
+        if self.score:
+            probed = self.score(probed)
+        for cq, vmaf in zip(cqs, probed):
+            self.results[cq] = vmaf
+
+    def points(self):
+        """Probed cq and vmaf values, sorted by cq."""
+        x = sorted(self.results)
+        return x, [self.results[i] for i in x]
+
+    def grid(self, steps):
+        """Probe evenly spaced cq values between min and max cq."""
+        self.run(np.unique(np.linspace(self.min_cq, self.max_cq, num=steps, dtype=int, endpoint=True)))
+        return self.points()
+
+    def bracket(self, lo, hi):
+        """Narrow lo/hi to closest probes that are above/below target."""
+        for cq in sorted(x for x in self.results if lo < x < hi):
+            if self.results[cq] >= self.target:
+                lo = cq
+            else:
+                hi = cq
+                break
+        return lo, hi
+
+    def estimate(self, lo, hi):
+        """Secant estimate of target cq between two probes."""
+        v_lo, v_hi = self.results[lo], self.results[hi]
+        if v_lo == v_hi:
+            return (lo + hi) / 2
+        return lo + (v_lo - self.target) * (hi - lo) / (v_lo - v_hi)
+
+    def candidates(self, lo, hi, bisect):
+        """Next round of cq values strictly between lo and hi."""
+        inside = [x for x in range(lo + 1, hi) if x not in self.results]
+        if not inside:
+            return []
+
+        guess = (lo + hi) / 2 if bisect else self.estimate(lo, hi)
+        if self.threads == 1:
+            wanted = [guess]
+        else:
+            # Spread probes over bracket, one of them on secant estimate
+            wanted = list(np.linspace(lo, hi, self.threads + 2)[1:-1])
+            wanted[min(range(len(wanted)), key=lambda i: abs(wanted[i] - guess))] = guess
+
+        picked = []
+        for w in wanted:
+            left = [x for x in inside if x not in picked]
+            if left:
+                picked.append(min(left, key=lambda x: abs(x - w)))
+        return picked
+
+    def adaptive(self, max_probes):
+        """
+        Bracketing secant search, falls back to bisection when secant step is slow.
+        Stops when a probe is within error of target, bracket is 1 cq wide or probes run out.
+        Returns cq and expected vmaf.
+        """
+        lo, hi = self.min_cq, self.max_cq
+        self.run([lo, hi])
+
+        if self.results[lo] <= self.target:
+            return lo, self.results[lo]
+        if self.results[hi] >= self.target:
+            return hi, self.results[hi]
+
+        bisect = False
+        while True:
+            lo, hi = self.bracket(lo, hi)
+            best = min(self.results, key=lambda x: abs(self.results[x] - self.target))
+            if abs(self.results[best] - self.target) <= self.error:
+                return best, self.results[best]
+
+            if hi - lo <= 1 or len(self.results) >= max_probes:
+                break
+
+            width = hi - lo
+            nxt = self.candidates(lo, hi, bisect)[:max_probes - len(self.results)]
+            if not nxt:
+                break
+            self.run(nxt)
+
+            # Secant that didn't halve bracket gets replaced by bisection next round
+            new_lo, new_hi = self.bracket(lo, hi)
+            bisect = not bisect and (new_hi - new_lo) * 2 > width
+
+        if hi - lo <= 1:
+            cq = min((lo, hi), key=lambda x: abs(self.results[x] - self.target))
+            return cq, self.results[cq]
+
+        est = self.estimate(lo, hi)
+        cq = int(round(est))
+        vmaf = np.interp(cq, [lo, hi], [self.results[lo], self.results[hi]])
+        return cq, float(vmaf)
+
+    def confirm(self, cq, slope, tolerance):
+        """
+        Check cq predicted by model with one probe. When it misses target by more than tolerance,
+        second probe is placed by predicted vmaf slope and cq is taken from secant of both probes.
+        Returns cq and expected vmaf.
+        """
+        self.run([cq])
+        vmaf = self.results[cq]
+        if abs(vmaf - self.target) <= tolerance:
+            return cq, vmaf
+
+        step = int(round((self.target - vmaf) / slope)) or (1 if vmaf > self.target else -1)
+        nxt = min(max(cq + step, self.min_cq), self.max_cq)
+        if nxt == cq:
+            return cq, vmaf
+        self.run([nxt])
+
+        lo, hi = sorted((cq, nxt))
+        v_lo, v_hi = self.results[lo], self.results[hi]
+        if v_lo <= v_hi:
+            # Noise instead of slope, closest probe is the best guess
+            best = min((lo, hi), key=lambda x: abs(self.results[x] - self.target))
+            return best, self.results[best]
+
+        # Secant, extrapolated at most one bracket width past probes
+        width = hi - lo
+        est = min(max(self.estimate(lo, hi), lo - width, self.min_cq), hi + width, self.max_cq)
+        new = int(round(est))
+        return new, float(v_lo + (new - lo) * (v_hi - v_lo) / width)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import multiprocessing
+from pathlib import Path
+
+# Set in pool workers by init_worker
+cache = None
+
+
+def init_worker(y4m_cache):
+    global cache
+    cache = y4m_cache
+
+
+def frame_bytes(width, height, pix_format):
+    """Size of single raw frame of given pixel format."""
+    chroma = 3 if '444' in pix_format else 2 if '422' in pix_format else 1.5
+    depth = 2 if any(x in pix_format for x in ('10', '12', '16')) else 1
+    return int(width * height * chroma * depth)
+
+
+class Y4MCache:
+    """
+    Bounded cache of decoded and filtered y4m streams, so both passes of two pass encode read the same file.
+    At most `slots` chunks and `budget` bytes are held at once across all pool workers.
+    A chunk that doesn't fit is decoded for every pass as without cache.
+    """
+
+    def __init__(self, folder: Path, slots, budget):
+        self.folder = Path(folder)
+        self.slots = slots
+        self.budget = budget
+        self.lock = multiprocessing.Lock()
+        self.count = multiprocessing.Value('i', 0, lock=False)
+        self.used = multiprocessing.Value('q', 0, lock=False)
+
+    def setup(self):
+        """Drop leftovers of interrupted runs."""
+        if self.folder.exists():
+            shutil.rmtree(self.folder)
+        self.folder.mkdir(parents=True)
+
+    def cleanup(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def acquire(self, name, size):
+        """Reserve space for chunk, returns path of its y4m file or None when cache is full."""
+        with self.lock:
+            if self.count.value >= self.slots or self.used.value + size > self.budget:
+                return None
+            self.count.value += 1
+            self.used.value += size
+        return self.folder / f'{Path(name).stem}.y4m'
+
+    def resize(self, expected, actual):
+        """Account real size of written file instead of estimate."""
+        with self.lock:
+            self.used.value += actual - expected
+
+    def release(self, path: Path, size):
+        """Evict chunk after its last pass."""
+        if path.exists():
+            os.remove(path)
+        with self.lock:
+            self.count.value -= 1
+            self.used.value -= size